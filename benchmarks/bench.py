@@ -0,0 +1,133 @@
+import logging
+import resource
+import tracemalloc
+from dataclasses import dataclass, field
+from time import perf_counter
+
+from prometheus_client import REGISTRY
+
+from load_data import (
+    ChangeCaptureManager,
+    ExtractionGenresManager,
+    ExtractionManager,
+    ExtractionMoviesManager,
+    ExtractionPersonManager,
+)
+from postgres_to_es import metrics
+from postgres_to_es.config.settings import settings
+from postgres_to_es.connections import (
+    ElasticConnectionManager,
+    ElasticConnector,
+    PostgresConnectionManager,
+    PostgresConnector,
+    RedisConnectionManager,
+    RedisConnector,
+)
+
+from .fakes import FakeElastic, FakeRedis
+
+MANAGERS: tuple[tuple[str, type[ExtractionManager]], ...] = (
+    (settings.elastic_movie_index, ExtractionMoviesManager),
+    (settings.elastic_genre_index, ExtractionGenresManager),
+    (settings.elastic_person_index, ExtractionPersonManager),
+)
+STAGES = ("enrich", "merge", "transform", "load")
+
+
+class FakeRedisConnector(RedisConnector):
+    def __init__(self, redis: FakeRedis):
+        super().__init__("localhost", 0)
+        self.redis = redis
+
+    def _connect(self) -> FakeRedis:  # type: ignore
+        return self.redis
+
+
+def stage_seconds() -> dict[str, float]:
+    seconds = {
+        f"scan {table}": REGISTRY.get_sample_value(
+            "etl_scan_seconds_sum", {"table": table}
+        )
+        or 0.0
+        for table, _ in settings.tables_for_scan
+    }
+    for index, _ in MANAGERS:
+        for stage in STAGES:
+            labels = {"index": index, "stage": stage}
+            value = REGISTRY.get_sample_value("etl_stage_seconds_sum", labels)
+            seconds[f"{stage} {index}"] = value or 0.0
+    return seconds
+
+
+@dataclass
+class Report:
+    name: str
+    seconds: float = 0.0
+    documents: int = 0
+    requests: int = 0
+    bytes: int = 0
+    peak_rss_mb: float = 0.0
+    traced_peak_mb: float | None = None
+    stages: dict[str, float] = field(default_factory=dict)
+
+    def show(self):
+        print(f"== {self.name}")
+        print(f"documents      {self.documents}")
+        print(f"seconds        {self.seconds:.2f}")
+        print(f"docs/sec       {self.documents / max(self.seconds, 1e-9):.0f}")
+        print(f"bulk requests  {self.requests} ({self.bytes / 2**20:.1f} MB)")
+        print(f"peak rss       {self.peak_rss_mb:.0f} MB")
+        if self.traced_peak_mb is not None:
+            print(f"traced peak    {self.traced_peak_mb:.1f} MB")
+        for stage, seconds in self.stages.items():
+            if seconds:
+                print(f"  {stage:<40} {seconds:.2f}s")
+
+
+class Benchmark:
+    """Runs the ETL against a local Postgres, a fake Elasticsearch and Redis"""
+
+    def __init__(self, elastic: FakeElastic, trace_memory: bool = False):
+        self.elastic = elastic
+        self.redis = FakeRedis()
+        self.trace_memory = trace_memory
+
+    def cycle(self):
+        with (
+            ElasticConnectionManager(ElasticConnector(self.elastic.url)) as elastic,
+            PostgresConnectionManager(PostgresConnector()) as postgres,
+            RedisConnectionManager(FakeRedisConnector(self.redis)) as redis,
+        ):
+            if settings.shared_scan:
+                ChangeCaptureManager(postgres, redis, elastic, MANAGERS).execute_etl()
+                return
+            for index, extractor in MANAGERS:
+                extractor(postgres, redis, elastic, index).execute_etl()
+
+    def run(self, name: str) -> Report:
+        stats = self.elastic.stats
+        documents = sum(stats.documents.values())
+        requests, nbytes = stats.requests, stats.bytes
+        stages = stage_seconds()
+        if self.trace_memory:
+            tracemalloc.start()
+
+        started = perf_counter()
+        with metrics.cycle.track():
+            self.cycle()
+        report = Report(name, seconds=perf_counter() - started)
+
+        if self.trace_memory:
+            report.traced_peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        report.documents = sum(stats.documents.values()) - documents
+        report.requests = stats.requests - requests
+        report.bytes = stats.bytes - nbytes
+        # kilobytes on linux
+        report.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        report.stages = {
+            stage: seconds - stages[stage] for stage, seconds in stage_seconds().items()
+        }
+        if not REGISTRY.get_sample_value("etl_last_cycle_success"):
+            logging.warning("Some batches failed, see the log")
+        return report
@@ -0,0 +1,193 @@
+"""Synthetic `content` schema of a given scale"""
+import io
+import logging
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
+from uuid import UUID
+
+from psycopg2.extensions import connection as pg_connection
+
+SCHEMA_SQL = """
+CREATE SCHEMA IF NOT EXISTS content;
+
+CREATE TABLE IF NOT EXISTS content.genre (
+    id uuid PRIMARY KEY,
+    name text NOT NULL,
+    description text,
+    created timestamp with time zone NOT NULL,
+    modified timestamp with time zone NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS content.person (
+    id uuid PRIMARY KEY,
+    full_name text NOT NULL,
+    created timestamp with time zone NOT NULL,
+    modified timestamp with time zone NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS content.film_work (
+    id uuid PRIMARY KEY,
+    title text NOT NULL,
+    description text,
+    rating float NOT NULL,
+    created timestamp with time zone NOT NULL,
+    modified timestamp with time zone NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS content.genre_film_work (
+    id uuid PRIMARY KEY,
+    genre_id uuid NOT NULL REFERENCES content.genre (id) ON DELETE CASCADE,
+    film_work_id uuid NOT NULL REFERENCES content.film_work (id) ON DELETE CASCADE,
+    created timestamp with time zone NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS content.person_film_work (
+    id uuid PRIMARY KEY,
+    person_id uuid NOT NULL REFERENCES content.person (id) ON DELETE CASCADE,
+    film_work_id uuid NOT NULL REFERENCES content.film_work (id) ON DELETE CASCADE,
+    role text NOT NULL,
+    created timestamp with time zone NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS genre_modified_id ON content.genre (modified, id);
+CREATE INDEX IF NOT EXISTS person_modified_id ON content.person (modified, id);
+CREATE INDEX IF NOT EXISTS film_work_modified_id
+    ON content.film_work (modified, id);
+CREATE INDEX IF NOT EXISTS genre_film_work_created_id
+    ON content.genre_film_work (created, id);
+CREATE INDEX IF NOT EXISTS person_film_work_created_id
+    ON content.person_film_work (created, id);
+CREATE INDEX IF NOT EXISTS genre_film_work_genre ON content.genre_film_work (genre_id);
+CREATE INDEX IF NOT EXISTS person_film_work_person
+    ON content.person_film_work (person_id);
+CREATE INDEX IF NOT EXISTS genre_film_work_film_work
+    ON content.genre_film_work (film_work_id);
+CREATE INDEX IF NOT EXISTS person_film_work_film_work
+    ON content.person_film_work (film_work_id);
+"""
+
+DROP_SQL = "DROP SCHEMA IF EXISTS content CASCADE;"
+
+ROLES = ("actor", "director", "writer")
+WORDS = (
+    "star night river city dream war love storm ghost king road winter "
+    "shadow house fire song ocean stone garden machine"
+).split()
+
+
+@dataclass
+class Scale:
+    films: int = 10000
+    persons: int = 5000
+    genres: int = 30
+    persons_per_film: int = 6
+    genres_per_film: int = 2
+
+
+class Catalogue:
+    """
+    Rows are drawn from a seeded generator,
+    the same scale and seed give the same catalogue
+    """
+
+    def __init__(self, scale: Scale, seed: int = 0):
+        self.scale = scale
+        self.random = random.Random(seed)
+        self.now = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+    def uuid(self) -> UUID:
+        return UUID(int=self.random.getrandbits(128), version=4)
+
+    def moment(self) -> datetime:
+        return self.now - timedelta(seconds=self.random.randrange(365 * 24 * 3600))
+
+    def words(self, count: int) -> str:
+        return " ".join(self.random.choices(WORDS, k=count)).capitalize()
+
+    def genres(self) -> list[tuple]:
+        return [
+            (self.uuid(), f"{self.words(1)} {number}", self.words(8), *self.times())
+            for number in range(self.scale.genres)
+        ]
+
+    def persons(self) -> list[tuple]:
+        return [
+            (self.uuid(), self.words(2), *self.times())
+            for _ in range(self.scale.persons)
+        ]
+
+    def films(self) -> list[tuple]:
+        return [
+            (
+                self.uuid(),
+                self.words(3),
+                self.words(30),
+                round(self.random.uniform(1, 10), 1),
+                *self.times(),
+            )
+            for _ in range(self.scale.films)
+        ]
+
+    def times(self) -> tuple[datetime, datetime]:
+        created = self.moment()
+        return created, created
+
+    def links(
+        self, films: list[tuple], others: list[tuple], per_film: int, roles: bool
+    ) -> Iterable[tuple]:
+        for film in films:
+            for other in self.random.sample(others, min(per_film, len(others))):
+                role = (self.random.choice(ROLES),) if roles else ()
+                yield (self.uuid(), other[0], film[0], *role, film[-1])
+
+
+def copy_rows(connection: pg_connection, table: str, rows: Iterable[tuple]):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(str(value) for value in row) + "\n")
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} FROM STDIN", buffer)
+
+
+def generate(connection: pg_connection, catalogue: Catalogue, recreate: bool = False):
+    with connection.cursor() as cursor:
+        if recreate:
+            cursor.execute(DROP_SQL)
+        cursor.execute(SCHEMA_SQL)
+
+    genres, persons, films = catalogue.genres(), catalogue.persons(), catalogue.films()
+    scale = catalogue.scale
+    copy_rows(connection, "content.genre", genres)
+    copy_rows(connection, "content.person", persons)
+    copy_rows(connection, "content.film_work", films)
+    copy_rows(
+        connection,
+        "content.genre_film_work",
+        catalogue.links(films, genres, scale.genres_per_film, roles=False),
+    )
+    copy_rows(
+        connection,
+        "content.person_film_work",
+        catalogue.links(films, persons, scale.persons_per_film, roles=True),
+    )
+    connection.commit()
+    logging.info(
+        f"Generated {scale.films} films, {scale.persons} persons, "
+        f"{scale.genres} genres"
+    )
+
+
+def touch(connection: pg_connection, rate: float, seed: int = 0):
+    """Marks `rate` of films, persons and genres as modified"""
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT setseed(%s);", (seed / 2**31,))
+        for table in ("content.film_work", "content.person", "content.genre"):
+            cursor.execute(
+                f"UPDATE {table} SET modified = now() WHERE random() < %s;", (rate,)
+            )
+            logging.info(f"Modified {cursor.rowcount} rows of {table}")
+    connection.commit()
@@ -0,0 +1,167 @@
+"""In-process stand-ins for Elasticsearch and Redis"""
+import json
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any, Mapping
+
+PRODUCT_HEADERS = {
+    "X-Elastic-Product": "Elasticsearch",
+    "Content-Type": "application/vnd.elasticsearch+json; compatible-with=8",
+}
+INFO = {
+    "name": "fake",
+    "cluster_name": "benchmark",
+    "version": {"number": "8.7.0", "build_flavor": "default"},
+    "tagline": "You Know, for Search",
+}
+SOURCE_OPERATIONS = ("index", "create", "update")
+
+
+class BulkStats:
+    def __init__(self):
+        self.lock = Lock()
+        self.documents: Counter[str] = Counter()
+        self.requests = 0
+        self.bytes = 0
+
+    def record(self, documents: Counter[str], size: int):
+        with self.lock:
+            self.documents.update(documents)
+            self.requests += 1
+            self.bytes += size
+
+
+class FakeElasticHandler(BaseHTTPRequestHandler):
+    """Accepts every bulk operation, answers anything else with success"""
+
+    server: "FakeElastic"
+
+    def log_message(self, *args):
+        ...
+
+    def _respond(self, body: Mapping[str, Any] | None = None):
+        payload = json.dumps(body or {"acknowledged": True}).encode()
+        self.send_response(200)
+        for header, value in PRODUCT_HEADERS.items():
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    def _bulk(self, body: bytes):
+        items, documents = [], Counter[str]()
+        lines = iter(body.splitlines())
+        for line in lines:
+            if not line.strip():
+                continue
+            ((operation, meta),) = json.loads(line).items()
+            if operation in SOURCE_OPERATIONS:
+                next(lines)
+            documents[meta.get("_index", "")] += 1
+            items.append({operation: {**meta, "status": 200, "result": "updated"}})
+
+        self.server.stats.record(documents, len(body))
+        self._respond({"took": 1, "errors": False, "items": items})
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if self.path.split("?")[0].endswith("/_bulk"):
+            self._bulk(body)
+        elif self.path.split("?")[0] == "/":
+            self._respond(INFO)
+        else:
+            self._respond()
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_DELETE = _handle
+
+
+class FakeElastic(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeElasticHandler)
+        self.stats = BulkStats()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+
+
+class FakeRedis:
+    """Commands the ETL uses, kept in a dict"""
+
+    def __init__(self):
+        self.data: dict[str, Any] = {}
+
+    def ping(self) -> bool:
+        return True
+
+    def close(self):
+        ...
+
+    def get(self, key: str) -> str | None:
+        return self.data.get(key)
+
+    def hset(self, key: str, mapping: Mapping[str, str]):
+        self.data.setdefault(key, {}).update(mapping)
+
+    def hgetall(self, key: str) -> dict[str, str]:
+        return dict(self.data.get(key, {}))
+
+    def hmget(self, key: str, keys: list[str]) -> list[str | None]:
+        stored = self.data.get(key, {})
+        return [stored.get(field) for field in keys]
+
+    def hdel(self, key: str, *keys: str) -> int:
+        stored = self.data.get(key, {})
+        return len([stored.pop(field) for field in keys if field in stored])
+
+    def delete(self, *keys: str) -> int:
+        return len([self.data.pop(key) for key in keys if key in self.data])
+
+    def exists(self, *keys: str) -> int:
+        return len([key for key in keys if key in self.data])
+
+    def rename(self, source: str, target: str) -> bool:
+        self.data[target] = self.data.pop(source)
+        return True
+
+    def xadd(
+        self, key: str, fields: Mapping[str, str], maxlen: int | None = None, **kwargs
+    ) -> str:
+        stream = self.data.setdefault(key, [])
+        entry_id = f"{len(stream) and int(stream[-1][0].split('-')[0]) + 1}-0"
+        stream.append((entry_id, dict(fields)))
+        if maxlen is not None:
+            del stream[:-maxlen]
+        return entry_id
+
+    def xrange(self, key: str, count: int | None = None) -> list[tuple[str, dict]]:
+        return list(self.data.get(key, []))[:count]
+
+    def xdel(self, key: str, *entry_ids: str) -> int:
+        stream = self.data.get(key, [])
+        kept = [entry for entry in stream if entry[0] not in entry_ids]
+        self.data[key] = kept
+        return len(stream) - len(kept)
+
+    def sadd(self, key: str, *values: str):
+        self.data.setdefault(key, set()).update(values)
+
+    def smembers(self, key: str) -> set[str]:
+        return set(self.data.get(key, set()))
+
+    def srem(self, key: str, *values: str):
+        self.data.get(key, set()).difference_update(values)
+
+    # after the annotations using the builtin set
+    def set(self, key: str, value: str | bytes, **kwargs):
+        self.data[key] = value.decode() if isinstance(value, bytes) else value
+        return True
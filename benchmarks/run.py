@@ -0,0 +1,86 @@
+"""
+Offline benchmark of the ETL.
+
+Generates a synthetic catalogue into the Postgres database given by
+POSTGRES_* variables, loads it with the full pipeline into an in-process
+fake Elasticsearch with state kept in memory instead of Redis, then
+modifies a part of the rows and loads the changes. Reports docs/sec,
+time of every stage and peak memory.
+
+    PYTHONPATH=src python -m benchmarks.run --generate --films 20000
+
+Use a database of its own: --generate --recreate drops the `content` schema.
+Other settings of the service (PIPELINED, COALESCE, JSON_SERIALIZER, ...)
+are read from the environment as usual.
+"""
+import argparse
+import logging
+import os
+
+from .fakes import FakeElastic
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--generate", action="store_true", help="fill the database")
+    parser.add_argument("--recreate", action="store_true", help="drop it before")
+    parser.add_argument("--films", type=int, default=10000)
+    parser.add_argument("--persons", type=int, default=5000)
+    parser.add_argument("--genres", type=int, default=30)
+    parser.add_argument("--persons-per-film", type=int, default=6)
+    parser.add_argument("--genres-per-film", type=int, default=2)
+    parser.add_argument(
+        "--change-rate",
+        type=float,
+        default=0.01,
+        help="part of rows modified before the incremental run, 0 to skip it",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="report peak of python allocations, slows the run down",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=os.environ.get("ETL_LOG_LEVEL", logging.WARNING))
+
+    elastic = FakeElastic()
+    elastic.start()
+    # settings of the service are read on import
+    os.environ.setdefault("ELASTIC_ENDPOINT", elastic.url)
+    os.environ.setdefault("REDIS_HOST", "localhost")
+    os.environ.setdefault("REDIS_PORT", "6379")
+
+    from postgres_to_es.connections import PostgresConnector
+
+    from .bench import Benchmark
+    from .catalogue import Catalogue, Scale, generate, touch
+
+    connector = PostgresConnector()
+    connection = connector.connect()
+    if args.generate:
+        scale = Scale(
+            args.films,
+            args.persons,
+            args.genres,
+            args.persons_per_film,
+            args.genres_per_film,
+        )
+        generate(connection, Catalogue(scale, args.seed), args.recreate)
+
+    benchmark = Benchmark(elastic, args.trace_memory)
+    benchmark.run("full load").show()
+    if args.change_rate > 0:
+        touch(connection, args.change_rate, args.seed)
+        benchmark.run("incremental load").show()
+    connector.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,85 @@
 """Loading data from Postgresql to ElasticSearch"""
+import asyncio
 import logging
 import os
+from collections import defaultdict
+from functools import partial
+from itertools import count
 from time import sleep
+from typing import Any, Iterable
 
-from postgres_to_es.config.settings import settings
+from postgres_to_es import aio, metrics
+from postgres_to_es.coalescing import DirtySet
+from postgres_to_es.config.settings import TOMBSTONE_TABLE, settings
 from postgres_to_es.connections import (
     ElasticConnectionManager,
-    ElasticConnector,
     PostgresConnectionManager,
     PostgresConnector,
     RedisConnectionManager,
-    RedisConnector,
+    get_pool,
 )
+from postgres_to_es.deadletters import create_dead_letter_store
 from postgres_to_es.enrichers import (
     EnricherManager,
     FilmsEnricherManager,
     GenreEnricherManager,
     PersonEnricherManager,
 )
-from postgres_to_es.exceptions import Error
+from postgres_to_es.exceptions import ConfigurationError, ConnectionFailedError, Error
+from postgres_to_es.hashes import create_hash_store
+from postgres_to_es.indices import IndexBootstrap
 from postgres_to_es.loaders import ElasticLoader
 from postgres_to_es.mergers import (
     FilmWorkPostgresMerger,
+    FlatFilmWorkPostgresMerger,
     GenrePostgresMerger,
     Merger,
     PersonPostgresMerger,
+    PostgresMerger,
+)
+from postgres_to_es.models import Entry
+from postgres_to_es.notifications import PostgresListener
+from postgres_to_es.pipeline import Batch, Pipeline, Stage
+from postgres_to_es.producers import (
+    PostgresProducer,
+    Producer,
+    SharedPostgresProducer,
+    check_scan_indexes,
+)
+from postgres_to_es.profiling import StageHooks, profile_cycle
+from postgres_to_es.scheduling import Scheduler
+from postgres_to_es.shards import LeaseKeeper, Shard, ShardLeases
+from postgres_to_es.state import RedisHashStorage, State
+from postgres_to_es.tombstones import (
+    Deletion,
+    TombstonePurger,
+    TombstoneReader,
+    install_tombstones,
 )
-from postgres_to_es.producers import PostgresProducer, Producer
-from postgres_to_es.state import RedisStorage, State
 from postgres_to_es.transformers import (
     FilmWork2MoviesTransformer,
     GenreTransformer,
     PersonTransformer,
     Transformer,
 )
+from postgres_to_es.updaters import FilmsUpdaterManager, UpdaterManager
+
+Tables = list[tuple[str, int]]
+
+# settings the async engine doesn't support
+ASYNC_UNSUPPORTED = (
+    "skip_unchanged",
+    "dead_letters",
+    "partial_updates",
+    "flat_film_merge",
+    "elastic_bulk_workers",
+    "elastic_bulk_chunk_bytes",
+    "adaptive_batching",
+    "coalesce",
+    "pipelined",
+    "profile_stages",
+    "trace_allocations",
+)
 
 logger = logging.getLogger()
 logger.setLevel(os.environ.get("ETL_LOG_LEVEL", logging.INFO))
@@ -45,95 +91,604 @@ class ExtractionManager:
     loader: ElasticLoader
     merger: Merger
     transformer: Transformer
+    state: State
     index_name: str
 
-    def execute_etl(self):
-        logging.debug(f"Executing etl for {self.index_name}...")
-        for table, changed in self.producer.scan(settings.tables_for_scan):
-            logging.debug(f"Produced keys for table {table}")
-            try:
-                for keys in self.enricher.enrich(table, changed):
-                    logging.debug(
-                        f"Enriching: table {table}, (index {self.index_name})"
-                    )
-                    for entries in self.merger.merge(keys):
-                        logging.debug(
-                            f"Merging: table {table}, (index {self.index_name})"
-                        )
-                        documents = self.transformer.transform(entries)
-                        logging.debug(
-                            f"Trasformed: table {table}, (index {self.index_name})"
-                        )
-                        self.loader.load(documents)
-                else:
-                    self.producer.set_state(table, self.index_name)
-            except Error as e:
-                logging.error(e)
-                continue
-        logging.info(f"Finished etl for {self.index_name}")
-
+    enricher_class: type[EnricherManager]
+    updater_class: type[UpdaterManager] | None = None
+    # deleted rows of this table are documents of the index
+    document_table = ""
+    # films lost links of deleted rows are rebuilt
+    rebuilds_unlinked = False
+    # deleted tables and the documents their ids are still linked to
+    links_sql: dict[str, str] = {}
+    merger_class: type[PostgresMerger]
+    transformer_class: type[Transformer]
 
-class ExtractionMoviesManager(ExtractionManager):
     def __init__(
         self,
         postgres: PostgresConnectionManager,
         redis: RedisConnectionManager,
         elastic: ElasticConnectionManager,
         index_name: str,
+        shard: Shard | None = None,
     ):
         self.postgres = postgres
         self.redis = redis
         self.elastic = elastic
-        self.storage = RedisStorage(self.redis)
+        self.storage = RedisHashStorage(self.redis)
         self.state = State(self.storage)
-        self.producer = PostgresProducer(self.state, self.postgres, index_name)
-        self.enricher = FilmsEnricherManager(self.postgres)
-        self.merger = FilmWorkPostgresMerger(self.postgres)
-        self.transformer = FilmWork2MoviesTransformer()
-        self.loader = ElasticLoader(elastic, index_name)
+        self.producer = PostgresProducer(self.state, self.postgres, index_name, shard)
+        self.enricher = self.enricher_class(self.postgres)
+        self.updater = (
+            self.updater_class(self.postgres, elastic, index_name)
+            if self.updater_class and settings.partial_updates
+            else None
+        )
+        self.tombstones = TombstoneReader(self.postgres)
+        self.merger = self.merger_class(self.postgres)
+        self.transformer = self.transformer_class()
+        self.loader = ElasticLoader(
+            elastic,
+            index_name,
+            create_hash_store(redis),
+            create_dead_letter_store(redis),
+        )
         self.index_name = index_name
+        self.dirty = DirtySet()
+        self.hooks = StageHooks(index_name)
+        # some batch of the last run wasn't loaded
+        self.failed = False
+
+    def execute_etl(self, tables: Tables | None = None):
+        logging.debug(f"Executing etl for {self.index_name}...")
+        self.failed = False
+        try:
+            self._execute_etl(tables or settings.tables_for_scan)
+        finally:
+            self.state.flush()
+            self.hooks.dump()
+        logging.info(f"Finished etl for {self.index_name}")
+
+    def enrich(self, table: str, changed: Iterable[Entry]) -> Iterable[list[Entry]]:
+        if self.updater and self.updater.handles(table):
+            changed = list(changed)
+            if self.loader.hashes:
+                # stored hashes won't match the updated documents
+                self.loader.forget(self.updater.matching(table, changed))
+            # nothing to rebuild, the documents are updated in place
+            with metrics.measure(self.index_name, "update"):
+                self.updater.update(table, changed)
+            return
+
+        if table == TOMBSTONE_TABLE:
+            enriched = self.hooks.wrap(self.bury(changed), "enrich")
+        else:
+            enriched = self.hooks.wrap(self.enricher.enrich(table, changed), "enrich")
+        for keys in metrics.timed(enriched, self.index_name, "enrich"):
+            if isinstance(keys, Deletion):
+                yield keys
+                continue
+            keys = list(keys)
+            metrics.IDS_ENRICHED.labels(self.index_name, table).inc(len(keys))
+            yield keys
+
+    def bury(self, changed: Iterable[Entry]) -> Iterable[Iterable[Entry] | Deletion]:
+        """
+        Yields documents of the deleted rows to delete, they go down the
+        stages so that loads of earlier batches don't bring them back, and
+        keys of documents which embedded the rest of them
+        """
+
+        tombstones = self.tombstones.resolve(changed)
+        yield Deletion(
+            tuple(
+                str(tombstone.row_id)
+                for tombstone in tombstones
+                if tombstone.table_name == self.document_table
+            )
+        )
+
+        unlinked, others = [], defaultdict(list)
+        for tombstone in tombstones:
+            if tombstone.table_name == self.document_table:
+                continue
+            if self.rebuilds_unlinked and tombstone.film_work_id:
+                unlinked.append(
+                    Entry(id=tombstone.film_work_id, modified=tombstone.deleted)
+                )
+            elif tombstone.table_name in self.links_sql:
+                others[tombstone.table_name].append(tombstone)
+
+        if unlinked:
+            yield unlinked
+        for table, buried in others.items():
+            # links the deleted rows left behind, if not cascaded
+            linked = self.tombstones.linked(self.links_sql[table], buried)
+            if linked:
+                yield linked
+
+    def merge(self, keys: Iterable[Entry] | Deletion) -> Iterable[list | Deletion]:
+        if isinstance(keys, Deletion):
+            yield keys
+            return
+        merged = self.hooks.wrap(self.merger.merge(keys), "merge")
+        for entries in metrics.timed(merged, self.index_name, "merge"):
+            entries = list(entries)
+            metrics.DOCUMENTS_MERGED.labels(self.index_name).inc(len(entries))
+            yield entries
+
+    def transform(self, entries: Iterable | Deletion) -> list | Deletion:
+        if isinstance(entries, Deletion):
+            return entries
+        with metrics.measure(self.index_name, "transform"):
+            with self.hooks.stage("transform"):
+                documents = list(self.transformer.transform(entries))
+        metrics.DOCUMENTS_TRANSFORMED.labels(self.index_name).inc(len(documents))
+        return documents
+
+    def load(self, documents: Iterable | Deletion):
+        if isinstance(documents, Deletion):
+            with metrics.measure(self.index_name, "delete"):
+                self.loader.delete(documents.ids)
+            return
+        with metrics.measure(self.index_name, "load"), self.hooks.stage("load"):
+            self.loader.load(documents)
+
+    def failed_batch(self, table: str = ""):
+        self.failed = True
+        metrics.cycle.failed(self.index_name, table)
+
+    def process(self, table: str, changed: Iterable[Entry]) -> bool:
+        """Loads documents affected by the changed rows of the table"""
+
+        try:
+            for keys in self.enrich(table, changed):
+                logging.debug(f"Enriching: table {table}, (index {self.index_name})")
+                for entries in self.merge(keys):
+                    logging.debug(f"Merging: table {table}, (index {self.index_name})")
+                    documents = self.transform(entries)
+                    logging.debug(
+                        f"Trasformed: table {table}, (index {self.index_name})"
+                    )
+                    self.load(documents)
+        except Error as e:
+            logging.error(e)
+            self.failed_batch(table)
+            return False
+        return True
+
+    def collect(self, table: str, changed: Iterable[Entry]) -> bool:
+        """Adds ids of documents affected by the changed rows to the dirty set"""
+
+        try:
+            for keys in self.enrich(table, changed):
+                if isinstance(keys, Deletion):
+                    # the dirty set is merged later, without the deleted rows
+                    self.load(keys)
+                else:
+                    self.dirty.add(keys)
+        except Error as e:
+            logging.error(e)
+            self.failed_batch(table)
+            return False
+        return True
+
+    def flush_dirty(self, producer: Producer) -> bool:
+        """
+        Loads every document of the dirty set once and stores checkpoints
+        of the batches collected into it
+        """
+
+        logging.debug(f"Loading {len(self.dirty)} documents to {self.index_name}")
+        try:
+            for keys in self.dirty.chunks(settings.elastic_pack_size):
+                for entries in self.merge(keys):
+                    self.load(self.transform(entries))
+        except Error as e:
+            logging.error(e)
+            self.failed_batch()
+            self.dirty.clear()
+            return False
+
+        for table, entity in self.dirty.checkpoints:
+            producer.checkpoint(table, self.index_name, entity)
+        self.dirty.clear()
+        return True
+
+    def _execute_etl(self, tables: Tables):
+        if settings.pipelined:
+            self._execute_pipelined(tables)
+            return
+
+        if settings.coalesce:
+            self._execute_coalesced(tables)
+            return
+
+        for table, changed in self.producer.scan(tables):
+            logging.debug(f"Produced keys for table {table}")
+            if self.process(table, changed):
+                self.producer.set_state(table, self.index_name)
+
+    def _execute_coalesced(self, tables: Tables):
+        for table, changed in self.producer.scan(tables):
+            logging.debug(f"Produced keys for table {table}")
+            if not self.collect(table, changed):
+                continue
+            self.dirty.checkpoint(table, self.producer.release(table))
+            if len(self.dirty) >= settings.coalesce_max_ids:
+                if not self.flush_dirty(self.producer):
+                    return
+        self.flush_dirty(self.producer)
+
+    def stages(self) -> tuple[Stage, ...]:
+        return (self._enrich, self._merge, self._transform, self._load)
+
+    def _enrich(self, batch: Batch, changed: Iterable[Entry]) -> Iterable:
+        return self.enrich(batch.table, changed)
+
+    def _merge(self, batch: Batch, keys: Iterable[Entry]) -> Iterable:
+        return self.merge(keys)
+
+    def _transform(self, batch: Batch, entries: Iterable) -> Iterable:
+        yield self.transform(entries)
+
+    def _load(self, batch: Batch, documents: Iterable) -> Iterable:
+        self.load(documents)
+        return ()
+
+    def _execute_pipelined(self, tables: Tables):
+        failed: set[str] = set()
+
+        def batches() -> Iterable[tuple[Batch, Any]]:
+            for table, changed in self.producer.scan(tables):
+                entity = self.producer.not_processed_entities[table]
+                yield Batch(table, self.index_name, entity), changed
+                # scanning of a failed table stops on the next batch
+                if table not in failed:
+                    self.producer.release(table)
+
+        def on_done(batch: Batch):
+            if batch.table not in failed:
+                # the producer thread keeps the mark of a failed batch
+                self.producer.checkpoint(batch.table, self.index_name, batch.entry)
+
+        def on_failed(batch: Batch):
+            failed.add(batch.table)
+            self.failed_batch(batch.table)
+
+        Pipeline(self.stages(), settings.pipeline_queue_size).run(
+            batches(), on_done, on_failed
+        )
+
+
+class ExtractionMoviesManager(ExtractionManager):
+    enricher_class = FilmsEnricherManager
+    updater_class = FilmsUpdaterManager
+    document_table = "content.film_work"
+    rebuilds_unlinked = True
+    links_sql = {
+        "content.person": (
+            "select distinct film_work_id from content.person_film_work "
+            "where person_id in %s;"
+        ),
+        "content.genre": (
+            "select distinct film_work_id from content.genre_film_work "
+            "where genre_id in %s;"
+        ),
+    }
+    merger_class = (
+        FlatFilmWorkPostgresMerger
+        if settings.flat_film_merge
+        else FilmWorkPostgresMerger
+    )
+    transformer_class = FilmWork2MoviesTransformer
 
 
 class ExtractionGenresManager(ExtractionManager):
-    def __init__(
-        self,
-        postgres: PostgresConnectionManager,
-        redis: RedisConnectionManager,
-        elastic: ElasticConnectionManager,
-        index_name: str,
-    ):
-        self.postgres = postgres
-        self.redis = redis
-        self.elastic = elastic
-        self.storage = RedisStorage(self.redis)
-        self.state = State(self.storage)
-        self.producer = PostgresProducer(self.state, self.postgres, index_name)
-        self.enricher = GenreEnricherManager(self.postgres)
-        self.merger = GenrePostgresMerger(self.postgres)
-        self.transformer = GenreTransformer()
-        self.loader = ElasticLoader(elastic, index_name)
-        self.index_name = index_name
+    enricher_class = GenreEnricherManager
+    document_table = "content.genre"
+    merger_class = GenrePostgresMerger
+    transformer_class = GenreTransformer
 
 
 class ExtractionPersonManager(ExtractionManager):
+    enricher_class = PersonEnricherManager
+    document_table = "content.person"
+    merger_class = PersonPostgresMerger
+    transformer_class = PersonTransformer
+
+
+INDEX_MANAGERS: dict[str, type[ExtractionManager]] = {
+    settings.elastic_movie_index: ExtractionMoviesManager,
+    settings.elastic_genre_index: ExtractionGenresManager,
+    settings.elastic_person_index: ExtractionPersonManager,
+}
+Managers = tuple[tuple[str, type[ExtractionManager]], ...]
+
+
+class ChangeCaptureManager:
+    """Scans changed rows once per cycle and dispatches them to every index"""
+
     def __init__(
         self,
         postgres: PostgresConnectionManager,
         redis: RedisConnectionManager,
         elastic: ElasticConnectionManager,
-        index_name: str,
+        managers: Iterable[tuple[str, type[ExtractionManager]]],
+        shard: Shard | None = None,
     ):
-        self.postgres = postgres
-        self.redis = redis
-        self.elastic = elastic
-        self.storage = RedisStorage(self.redis)
+        self.storage = RedisHashStorage(redis)
         self.state = State(self.storage)
-        self.producer = PostgresProducer(self.state, self.postgres, index_name)
-        self.enricher = PersonEnricherManager(self.postgres)
-        self.merger = PersonPostgresMerger(self.postgres)
-        self.transformer = PersonTransformer()
-        self.loader = ElasticLoader(elastic, index_name)
-        self.index_name = index_name
+        self.extractors = {
+            index: extractor(postgres, redis, elastic, index)
+            for index, extractor in managers
+        }
+        self.producer = SharedPostgresProducer(
+            self.state, postgres, self.extractors.keys(), shard
+        )
+
+    def execute_etl(self, tables: Tables | None = None):
+        logging.debug(f"Executing shared etl for {', '.join(self.extractors)}...")
+        try:
+            if settings.pipelined:
+                self._execute_pipelined(tables or settings.tables_for_scan)
+            elif settings.coalesce:
+                self._execute_coalesced(tables or settings.tables_for_scan)
+            else:
+                self._execute_etl(tables or settings.tables_for_scan)
+        finally:
+            self.state.flush()
+            for extractor in self.extractors.values():
+                extractor.hooks.dump()
+        logging.info("Finished shared etl")
+
+    def _execute_etl(self, tables: Tables):
+        for table, changed in self.producer.scan(tables):
+            logging.debug(f"Produced keys for table {table}")
+            for index, entries in self.producer.consumers(table, changed):
+                if self.extractors[index].process(table, entries):
+                    self.producer.set_state(table, index)
+                else:
+                    self.producer.set_failed(table, index)
+
+    def _flush_dirty(self, broken: set[str]):
+        for index, extractor in self.extractors.items():
+            if index not in broken and not extractor.flush_dirty(self.producer):
+                broken.add(index)
+
+    def _execute_coalesced(self, tables: Tables):
+        # indices failed to load their dirty set skip the rest of the cycle
+        broken: set[str] = set()
+
+        for table, changed in self.producer.scan(tables):
+            logging.debug(f"Produced keys for table {table}")
+            entity = self.producer.not_processed_entities[table]
+            for index, entries in self.producer.consumers(table, changed):
+                extractor = self.extractors[index]
+                if index in broken or not extractor.collect(table, entries):
+                    self.producer.set_failed(table, index)
+                    continue
+                extractor.dirty.checkpoint(table, entity)
+
+            if any(
+                len(extractor.dirty) >= settings.coalesce_max_ids
+                for extractor in self.extractors.values()
+            ):
+                self._flush_dirty(broken)
+        self._flush_dirty(broken)
+
+    def _stage(self, position: int, batch: Batch, payload: Any) -> Iterable:
+        return self.extractors[batch.index_name].stages()[position](batch, payload)
+
+    def _execute_pipelined(self, tables: Tables):
+        def batches() -> Iterable[tuple[Batch, Any]]:
+            for table, changed in self.producer.scan(tables):
+                entity = self.producer.not_processed_entities[table]
+                for index, entries in self.producer.consumers(table, changed):
+                    yield Batch(table, index, entity), entries
+
+        def on_done(batch: Batch):
+            if batch.index_name not in self.producer.failed[batch.table]:
+                self.producer.checkpoint(batch.table, batch.index_name, batch.entry)
+
+        def on_failed(batch: Batch):
+            self.producer.set_failed(batch.table, batch.index_name)
+            self.extractors[batch.index_name].failed_batch(batch.table)
+
+        stages = [partial(self._stage, position) for position in range(4)]
+        Pipeline(stages, settings.pipeline_queue_size).run(
+            batches(), on_done, on_failed
+        )
+
+
+def connection_managers() -> tuple[
+    ElasticConnectionManager, PostgresConnectionManager, RedisConnectionManager
+]:
+    """Managers of the connections kept open across cycles"""
+
+    return get_pool().managers()
+
+
+def run_separately(
+    managers: Iterable[tuple[str, type[ExtractionManager]]],
+    tables: Tables,
+    shard: Shard | None = None,
+):
+    for index, extractor in managers:
+        elastic_manager, postgres_manager, redis_manager = connection_managers()
+        with (
+            elastic_manager as elastic,
+            postgres_manager as postgres,
+            redis_manager as redis,
+        ):
+            logging.debug(f"Scanning for index {index}")
+            manager = extractor(postgres, redis, elastic, index, shard)
+            manager.execute_etl(tables)
+            del manager
+
+
+def run_shared(
+    managers: Iterable[tuple[str, type[ExtractionManager]]],
+    tables: Tables,
+    shard: Shard | None = None,
+):
+    elastic_manager, postgres_manager, redis_manager = connection_managers()
+    with (
+        elastic_manager as elastic,
+        postgres_manager as postgres,
+        redis_manager as redis,
+    ):
+        extractor = ChangeCaptureManager(postgres, redis, elastic, managers, shard)
+        extractor.execute_etl(tables)
+
+
+def create_listener() -> PostgresListener | None:
+    if not settings.listen_notify:
+        return None
+
+    listener = PostgresListener(PostgresConnector())
+    if settings.notify_install_triggers:
+        listener.install_triggers([table for table, _ in settings.tables_for_scan])
+    return listener
+
+
+def wait_for_changes(listener: PostgresListener | None) -> Tables:
+    """Tables to scan in the next cycle"""
+
+    if not listener:
+        logging.debug("Sleeping...")
+        sleep(settings.wait_up_to)
+        return settings.tables_for_scan
+
+    changed = listener.wait(settings.notify_fallback_interval)
+    if not changed:
+        logging.debug("No notifications, falling back to the full scan")
+        return settings.tables_for_scan
+
+    return [
+        (table, size) for table, size in settings.tables_for_scan if table in changed
+    ]
+
+
+def run_async(managers: Iterable[tuple[str, type[ExtractionManager]]], tables: Tables):
+    specs = [
+        (
+            index,
+            extractor.enricher_class,
+            extractor.merger_class,
+            extractor.transformer_class,
+        )
+        for index, extractor in managers
+    ]
+    asyncio.run(aio.execute_etl(specs, tables))
+
+
+def check_engine():
+    if settings.etl_engine != "async":
+        return
+
+    unsupported = [
+        name.upper()
+        for name in ASYNC_UNSUPPORTED
+        if getattr(settings, name) != settings.__fields__[name].default
+    ]
+    if unsupported:
+        raise ConfigurationError(
+            f"Not supported by the async engine: {', '.join(unsupported)}"
+        )
+
+
+def check_profiling():
+    if settings.profile_cycles and settings.profile_stages:
+        # a stage profiler would stop the cycle profiler of its thread
+        raise ConfigurationError("PROFILE_CYCLES and PROFILE_STAGES exclude each other")
+
+
+def run_cycle(
+    managers: Iterable[tuple[str, type[ExtractionManager]]],
+    tables: Tables,
+    shard: Shard | None = None,
+):
+    if settings.etl_engine == "async":
+        run_async(managers, tables)
+    elif settings.shared_scan:
+        run_shared(managers, tables, shard)
+    else:
+        run_separately(managers, tables, shard)
+
+
+def run_sharded(
+    managers: Iterable[tuple[str, type[ExtractionManager]]],
+    tables: Tables,
+    leases: ShardLeases,
+):
+    for shard in leases.claim():
+        if not leases.holds(shard):
+            continue
+        logging.debug(f"Processing shard {shard.number} of {shard.count}")
+        run_cycle(managers, tables, shard)
+
+
+def create_leases() -> ShardLeases | None:
+    if settings.shard_count < 2:
+        return None
+
+    if settings.etl_engine == "async":
+        raise ConfigurationError("Sharding is not supported by the async engine")
+
+    leases = ShardLeases(RedisConnectionManager(get_pool().redis, persistent=True))
+    LeaseKeeper(leases).start()
+    return leases
+
+
+def bootstrap_indices():
+    elastic_manager, _, redis_manager = connection_managers()
+    with elastic_manager as elastic, redis_manager as redis:
+        flagged = IndexBootstrap(elastic, redis).run()
+    if flagged:
+        logging.warning(f"Run reindex.py --flagged to rebuild {', '.join(flagged)}")
+
+
+def check_indexes():
+    _, postgres_manager, _ = connection_managers()
+    with postgres_manager as postgres:
+        check_scan_indexes(postgres, settings.tables_for_scan)
+
+
+def create_purger() -> TombstonePurger | None:
+    if not settings.propagate_deletes:
+        return None
+
+    if settings.etl_engine == "async":
+        raise ConfigurationError("Deletes are not propagated by the async engine")
+
+    if settings.tombstone_install_triggers:
+        _, postgres_manager, _ = connection_managers()
+        with postgres_manager as postgres:
+            install_tombstones(postgres)
+    return TombstonePurger()
+
+
+def create_scheduler(tables: Tables) -> Scheduler | None:
+    if not settings.adaptive_schedule:
+        return None
+
+    if settings.listen_notify:
+        raise ConfigurationError("Adaptive schedule replaces listening to changes")
+    return Scheduler(INDEX_MANAGERS, tables)
+
+
+def next_cycle(
+    listener: PostgresListener | None, scheduler: Scheduler | None
+) -> tuple[Managers, Tables]:
+    """Indices to load in the next cycle and tables to scan for them"""
+
+    if not scheduler:
+        return tuple(INDEX_MANAGERS.items()), wait_for_changes(listener)
+
+    index_names, tables = scheduler.wait()
+    return tuple((name, INDEX_MANAGERS[name]) for name in index_names), tables
 
 
 def transfer():
@@ -142,35 +697,42 @@ def transfer():
     logging.debug("Beginning the extraction process...")
     logging.debug("Trying to establsh connection with db...")
 
-    managers = (
-        (settings.elastic_movie_index, ExtractionMoviesManager),
-        (settings.elastic_genre_index, ExtractionGenresManager),
-        (settings.elastic_person_index, ExtractionPersonManager),
-    )
+    check_engine()
+    check_profiling()
+    metrics.serve()
+    bootstrap_indices()
+    # the tombstone table is checked with the rest of the scanned ones
+    purger = create_purger()
+    check_indexes()
+    listener = create_listener()
+    leases = create_leases()
+    scheduler = create_scheduler(settings.tables_for_scan)
+    managers, tables = tuple(INDEX_MANAGERS.items()), settings.tables_for_scan
 
-    while True:
+    for number in count(1):
         try:
-            for index, extractor in managers:
-                elastic_manager = ElasticConnectionManager(ElasticConnector())
-                postgres_manager = PostgresConnectionManager(PostgresConnector())
-                redis_manager = RedisConnectionManager(RedisConnector())
-                with (
-                    elastic_manager as elastic,
-                    postgres_manager as postgres,
-                    redis_manager as redis,
-                ):
-                    logging.debug(f"Scanning for index {index}")
-                    manager = extractor(postgres, redis, elastic, index)
-                    manager.execute_etl()
-                    del manager
-
-            logging.debug("Sleeping...")
-            sleep(settings.wait_up_to)
+            with metrics.cycle.track(), profile_cycle(number):
+                if leases:
+                    run_sharded(managers, tables, leases)
+                else:
+                    run_cycle(managers, tables)
+
+            if purger:
+                purger()
+            managers, tables = next_cycle(listener, scheduler)
+
+        except ConnectionFailedError as e:
+            # a backend is down, the whole scan is tried again after a while
+            logging.error(e)
+            sleep(settings.breaker_cooldown)
+            managers = tuple(INDEX_MANAGERS.items())
+            tables = settings.tables_for_scan
 
         except Exception as e:
             logging.error(type(e))
             logging.error(e)
             logging.error("Exited scan...")
+            get_pool().close()
             return
 
 
@@ -0,0 +1,3 @@
+from .etl import AsyncExtractionManager, execute_etl
+
+__all__ = ['AsyncExtractionManager', 'execute_etl']
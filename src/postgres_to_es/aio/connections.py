@@ -0,0 +1,272 @@
+import logging
+import re
+from abc import ABC, abstractmethod
+from functools import partial, wraps
+from inspect import isasyncgenfunction
+from typing import Any, AsyncIterator, Callable, Iterable, Mapping
+
+import asyncpg
+from asyncpg import Connection, Pool, Record
+from elasticsearch import AsyncElasticsearch, TransportError
+from elasticsearch.helpers import BulkIndexError, async_bulk
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from ..config.settings import settings
+from ..connections import PostgresConnector
+from ..exceptions import DataInconsistentError
+from ..retries import Retrying, connection_policy, get_breaker
+from ..serializers import elastic_serializers, get_serializer
+
+CONNECTION_ERRORS = (
+    OSError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    TransportError,
+    RedisError,
+)
+
+
+def to_asyncpg(sql: str) -> str:
+    """
+    Turns psycopg2 placeholders into numbered ones,
+    `in %s` with a tuple of ids becomes `= any($1)` with a list
+    """
+
+    sql = re.sub(r"\s+in\s+%s", " = any(%s::uuid[])", sql, flags=re.IGNORECASE)
+    parts = sql.split("%s")
+    numbered = [f"{part}${number}" for number, part in enumerate(parts[:-1], 1)]
+    return "".join(numbered) + parts[-1]
+
+
+def encode_json(data: Any) -> str:
+    return get_serializer().dumps(data).decode()
+
+
+async def init_postgres_connection(connection: Connection):
+    # the same json decoding psycopg2 does
+    for type_name in ("json", "jsonb"):
+        await connection.set_type_codec(
+            type_name,
+            encoder=encode_json,
+            decoder=get_serializer().loads,
+            schema="pg_catalog",
+        )
+
+
+class AsyncConnector(ABC):
+    backend = ""
+
+    def __init__(self):
+        self.connection: Pool | AsyncElasticsearch | Redis | None = None
+
+    @abstractmethod
+    async def _connect(self) -> Pool | AsyncElasticsearch | Redis:
+        ...
+
+    @abstractmethod
+    async def _ping(self):
+        ...
+
+    @abstractmethod
+    async def _close(self):
+        ...
+
+    async def connect(self) -> Pool | AsyncElasticsearch | Redis:
+        if not self.connection:
+            self.connection = await self._connect()
+        return self.connection
+
+    async def reconnect(self):
+        await self.close()
+        self.connection = await self._connect()
+        await self._ping()
+
+    async def close(self):
+        if not self.connection:
+            return
+        try:
+            await self._close()
+        except CONNECTION_ERRORS as e:
+            logging.debug(e)
+        self.connection = None
+
+
+class AsyncPostgresConnector(AsyncConnector):
+    backend = "postgres"
+
+    def __init__(self, dsl: dict | None = None):
+        super().__init__()
+        dsl = dict(PostgresConnector(dsl).dsl)
+        dsl["database"] = dsl.pop("dbname")
+        self.dsl = dsl
+
+    async def _connect(self) -> Pool:
+        return await asyncpg.create_pool(
+            **self.dsl,
+            min_size=1,
+            # every concurrent scan may wait for enricher and merger queries
+            max_size=settings.async_concurrency * 3,
+            init=init_postgres_connection,
+        )
+
+    async def _ping(self):
+        await self.connection.fetchval("SELECT 1;")  # type: ignore
+
+    async def _close(self):
+        await self.connection.close()  # type: ignore
+
+
+class AsyncElasticConnector(AsyncConnector):
+    backend = "elastic"
+
+    def __init__(self, endpoint: str | None = None):
+        super().__init__()
+        self.endpoint = endpoint or settings.elastic_endpoint
+
+    async def _connect(self) -> AsyncElasticsearch:
+        return AsyncElasticsearch(self.endpoint, serializers=elastic_serializers())
+
+    async def _ping(self):
+        if not await self.connection.ping():  # type: ignore
+            raise TransportError("No ping from ElasticSearch")
+
+    async def _close(self):
+        await self.connection.close()  # type: ignore
+
+
+class AsyncRedisConnector(AsyncConnector):
+    backend = "redis"
+
+    def __init__(self, host: str | None = None, port: int | None = None):
+        super().__init__()
+        self.host = host or settings.redis_host
+        self.port = port or settings.redis_port
+
+    async def _connect(self) -> Redis:
+        return Redis(host=self.host, port=self.port, decode_responses=True)
+
+    async def _ping(self):
+        await self.connection.ping()  # type: ignore
+
+    async def _close(self):
+        await self.connection.close()  # type: ignore
+
+
+def backing_connect(connector: AsyncConnector) -> Callable:
+    """Async counterpart of `connections.backing_connect`"""
+
+    retrying = Retrying(
+        connection_policy(),
+        get_breaker(connector.backend),
+        CONNECTION_ERRORS,
+        connector.reconnect,
+    )
+
+    def decorator(func: Callable):
+        if isasyncgenfunction(func):
+            return wraps(func)(partial(retrying.aiterate, func))
+        return wraps(func)(partial(retrying.acall, func))
+
+    return decorator
+
+
+class AsyncConnectionManager:
+    def __init__(self, connector: AsyncConnector):
+        self.connector = connector
+
+    def back_connection(self) -> Callable:
+        return backing_connect(self.connector)
+
+    async def get_connection(self) -> Pool | AsyncElasticsearch | Redis:
+        return await self.back_connection()(self.connector.connect)()
+
+    @property
+    def connection(self) -> Any:
+        # always the current one, the connector replaces it on reconnect
+        return self.connector.connection
+
+    async def __aenter__(self):
+        await self.get_connection()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.connector.close()
+        logging.debug("Closed connection")
+
+
+class AsyncRedisConnectionManager(AsyncConnectionManager):
+    def __init__(self, connector: AsyncRedisConnector):
+        super().__init__(connector)
+
+    async def _hgetall(self, key: str) -> dict[str, str]:
+        return await self.connection.hgetall(key)
+
+    async def _hset(self, key: str, mapping: Mapping[str, str]):
+        await self.connection.hset(key, mapping=mapping)
+
+    async def _get(self, key: str) -> str | None:
+        return await self.connection.get(key)
+
+    async def hgetall(self, key: str) -> dict[str, str]:
+        return await self.back_connection()(self._hgetall)(key)
+
+    async def hset(self, key: str, mapping: Mapping[str, str]):
+        await self.back_connection()(self._hset)(key, mapping)
+
+    async def get(self, key: str) -> str | None:
+        return await self.back_connection()(self._get)(key)
+
+
+class AsyncPostgresConnectionManager(AsyncConnectionManager):
+    def __init__(self, connector: AsyncPostgresConnector):
+        super().__init__(connector)
+
+    async def _fetch(self, sql: str, *args: Any) -> list[Record]:
+        return await self.connection.fetch(sql, *args)
+
+    async def fetch(self, sql: str, *args: Any) -> list[Record]:
+        """pool.fetch() with reconnect"""
+
+        return await self.back_connection()(self._fetch)(sql, *args)
+
+    async def _acquire(self) -> Connection:
+        return await self.connection.acquire()
+
+    async def _fetchmany(
+        self, sql: str, size: int, *args: Any
+    ) -> AsyncIterator[list[Record]]:
+        connection = await self._acquire()
+        try:
+            async with connection.transaction():
+                cursor = await connection.cursor(sql, *args)
+                while rows := await cursor.fetch(size):
+                    yield rows
+        finally:
+            await self.connection.release(connection)
+
+    def fetchmany(self, sql: str, size: int, *args: Any) -> AsyncIterator[list[Record]]:
+        """
+        Reads rows by batches of `size` with a server-side cursor.
+        A query failed while reading is run again and its rows are read
+        from the start, so callers must tolerate repeated rows
+        """
+
+        return self.back_connection()(self._fetchmany)(sql, size, *args)
+
+
+class AsyncElasticConnectionManager(AsyncConnectionManager):
+    def __init__(self, connector: AsyncElasticConnector):
+        super().__init__(connector)
+
+    async def _bulk(self, operations: Iterable[Mapping[str, Any]]) -> tuple:
+        return await async_bulk(self.connection, operations)
+
+    async def bulk(self, operations: Iterable[Mapping[str, Any]]):
+        try:
+            rows_count, errors = await self.back_connection()(self._bulk)(operations)
+            logging.debug(f"Persisted {rows_count} entries")
+            logging.debug(f"Persisted with errors: {errors}")
+        except BulkIndexError as e:
+            logging.error(e.errors)
+            raise DataInconsistentError(e)
@@ -0,0 +1,43 @@
+import logging
+from typing import AsyncIterator
+
+from ..enrichers import EnricherManager
+from ..models import Entry
+from .connections import AsyncPostgresConnectionManager, to_asyncpg
+
+
+class AsyncEnricherManager:
+    """
+    Runs queries of enrichers of a sync `EnricherManager` on asyncpg.
+
+    Enrichers without a query pass entries through.
+    """
+
+    def __init__(
+        self,
+        manager: AsyncPostgresConnectionManager,
+        enricher_manager: type[EnricherManager],
+        pack_size: int = 1000,
+    ):
+        self.manager = manager
+        self.pack_size = pack_size
+        self._sql = {
+            enricher.table_name: to_asyncpg(getattr(enricher, "sql", ""))
+            for enricher in enricher_manager.enrichers
+        }
+
+    async def enrich(
+        self, table_name: str, entries: list[Entry]
+    ) -> AsyncIterator[list[Entry]]:
+        if table_name not in self._sql:
+            logging.warning(f"No enricher created for table {table_name}!")
+            return
+
+        sql = self._sql[table_name]
+        if not sql:
+            yield entries
+            return
+
+        ids = [entry.id for entry in entries]
+        async for rows in self.manager.fetchmany(sql, self.pack_size, ids):
+            yield [Entry(modified=row[0], id=row[1]) for row in rows]
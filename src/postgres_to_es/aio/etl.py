@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import Iterable
+
+from .. import metrics
+from ..config.settings import settings
+from ..enrichers import EnricherManager
+from ..exceptions import Error
+from ..mergers import PostgresMerger
+from ..models import Entry
+from ..transformers import Transformer
+from .connections import (
+    AsyncElasticConnectionManager,
+    AsyncElasticConnector,
+    AsyncPostgresConnectionManager,
+    AsyncPostgresConnector,
+    AsyncRedisConnectionManager,
+    AsyncRedisConnector,
+)
+from .enrichers import AsyncEnricherManager
+from .loaders import AsyncElasticLoader
+from .mergers import AsyncPostgresMerger
+from .producers import AsyncPostgresProducer
+from .state import AsyncRedisHashStorage, AsyncState
+
+IndexSpec = tuple[str, type[EnricherManager], type[PostgresMerger], type[Transformer]]
+
+
+class AsyncExtractionManager:
+    def __init__(
+        self,
+        postgres: AsyncPostgresConnectionManager,
+        elastic: AsyncElasticConnectionManager,
+        state: AsyncState,
+        spec: IndexSpec,
+    ):
+        index_name, enricher_class, merger_class, transformer_class = spec
+        self.producer = AsyncPostgresProducer(state, postgres, index_name)
+        self.enricher = AsyncEnricherManager(postgres, enricher_class)
+        self.merger = AsyncPostgresMerger(postgres, merger_class)
+        self.transformer = transformer_class()
+        self.loader = AsyncElasticLoader(elastic, index_name)
+        self.index_name = index_name
+
+    async def process(self, table: str, changed: list[Entry]) -> bool:
+        try:
+            async with aclosing(self.enricher.enrich(table, changed)) as enriched:
+                async for keys in enriched:
+                    async with aclosing(self.merger.merge(keys)) as merged:
+                        async for entries in merged:
+                            documents = self.transformer.transform(entries)
+                            await self.loader.load(documents)
+        except Error as e:
+            logging.error(e)
+            metrics.cycle.failed(self.index_name, table)
+            return False
+        return True
+
+    async def scan_table(self, table: str, pack_size: int):
+        logging.debug(f"Scanning {table} for index {self.index_name}")
+        async with aclosing(self.producer.scan_table(table, pack_size)) as produced:
+            async for changed in produced:
+                if not await self.process(table, changed):
+                    # the rest is scanned again next cycle
+                    return
+                await self.producer.set_state(table, changed[-1])
+
+
+async def execute_etl(specs: Iterable[IndexSpec], tables: list[tuple[str, int]]):
+    """Scans all tables for all indices concurrently on one event loop"""
+
+    async with (
+        AsyncElasticConnectionManager(AsyncElasticConnector()) as elastic,
+        AsyncPostgresConnectionManager(AsyncPostgresConnector()) as postgres,
+        AsyncRedisConnectionManager(AsyncRedisConnector()) as redis,
+    ):
+        state = AsyncState(AsyncRedisHashStorage(redis))
+        await state.refresh()
+        limit = asyncio.Semaphore(settings.async_concurrency)
+
+        async def scan(manager: AsyncExtractionManager, table: str, pack_size: int):
+            async with limit:
+                await manager.scan_table(table, pack_size)
+
+        managers = [
+            AsyncExtractionManager(postgres, elastic, state, spec) for spec in specs
+        ]
+        try:
+            await asyncio.gather(
+                *(
+                    scan(manager, table, pack_size)
+                    for manager in managers
+                    for table, pack_size in tables
+                )
+            )
+        finally:
+            await state.flush()
+        logging.info("Finished async etl")
@@ -0,0 +1,13 @@
+from typing import Any, Iterable, Mapping
+
+from ..loaders import ElasticLoader
+from .connections import AsyncElasticConnectionManager
+
+
+class AsyncElasticLoader(ElasticLoader):
+    def __init__(self, manager: AsyncElasticConnectionManager, index_name: str):
+        super().__init__(manager, index_name)  # type: ignore
+
+    async def load(self, items: Iterable[Mapping[str, Any]]):  # type: ignore
+        operations = self._prepare_operations(items)
+        await self.manager.bulk(operations)  # type: ignore
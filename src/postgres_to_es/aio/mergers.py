@@ -0,0 +1,29 @@
+from typing import AsyncIterator, Iterable
+
+from ..config.settings import settings
+from ..mergers import PostgresMerger
+from ..models import Entry
+from .connections import AsyncPostgresConnectionManager, to_asyncpg
+
+
+class AsyncPostgresMerger:
+    """Runs the query of a sync `PostgresMerger` on asyncpg"""
+
+    def __init__(
+        self, manager: AsyncPostgresConnectionManager, merger: type[PostgresMerger]
+    ):
+        self.manager = manager
+        # only row transformation of the sync merger is used
+        self.merger = merger(manager)  # type: ignore
+        self._sql = to_asyncpg(merger.sql)
+
+    async def merge(self, entries: Iterable[Entry]) -> AsyncIterator[Iterable]:
+        ids = [entry.id for entry in entries]
+
+        if not ids:
+            return
+
+        async for rows in self.manager.fetchmany(
+            self._sql, settings.elastic_pack_size, ids
+        ):
+            yield self.merger.transform_to_entries(rows)
@@ -0,0 +1,46 @@
+from time import monotonic
+from typing import AsyncIterator
+
+from .. import metrics
+from ..models import Entry
+from ..producers import scan_sql
+from .connections import AsyncPostgresConnectionManager, to_asyncpg
+from .state import AsyncState
+
+
+class AsyncPostgresProducer:
+    def __init__(
+        self,
+        state: AsyncState,
+        manager: AsyncPostgresConnectionManager,
+        index_name: str,
+    ):
+        self.state = state
+        self.manager = manager
+        self.index_name = index_name
+
+    async def scan_table(
+        self, table: str, pack_size: int
+    ) -> AsyncIterator[list[Entry]]:
+        state = self.state.get_state(f"{self.index_name}:{table}")
+        metrics.watermark(self.index_name, table, state.modified)
+
+        while True:
+            sql, sql_vars = scan_sql(table, state, pack_size)
+            started = monotonic()
+            rows = await self.manager.fetch(to_asyncpg(sql), *sql_vars)
+            metrics.SCAN_SECONDS.labels(table).observe(monotonic() - started)
+            metrics.ROWS_PRODUCED.labels(table).inc(len(rows))
+            if not rows:
+                return
+
+            entries = [Entry(modified=row[0], id=row[1]) for row in rows]
+            yield entries
+
+            if len(rows) < pack_size:
+                return
+            state = entries[-1]
+
+    async def set_state(self, table: str, entity: Entry):
+        await self.state.set_state(f"{self.index_name}:{table}", entity)
+        metrics.watermark(self.index_name, table, entity.modified)
@@ -0,0 +1,68 @@
+from typing import Any
+
+from ..config.settings import settings
+from ..models import Entry
+from ..serializers import get_serializer
+from ..state import parse_entry, serialize_entry
+from .connections import AsyncRedisConnectionManager
+
+
+class AsyncRedisHashStorage:
+    """Async counterpart of `state.RedisHashStorage`"""
+
+    def __init__(self, conn_mann: AsyncRedisConnectionManager, key: str | None = None):
+        self.conn_mann = conn_mann
+        self.key = key or settings.state_key
+
+    async def save_state(self, state: dict[str, Any]):
+        if not state:
+            return
+        await self.conn_mann.hset(self.key, state)
+
+    async def retrieve_state(self) -> dict[str, Any]:
+        state = await self.conn_mann.hgetall(self.key)
+        if state:
+            return state
+
+        serialized = await self.conn_mann.get(settings.state_legacy_key)
+        if not serialized:
+            return {}
+        legacy = get_serializer().loads(serialized)
+        await self.save_state(legacy)
+        return legacy
+
+
+class AsyncState:
+    """
+    Write-back cache in front of an async storage, see `state.State`.
+
+    `refresh()` has to be awaited before the first `get_state()`.
+    """
+
+    def __init__(self, storage: AsyncRedisHashStorage, flush_size: int | None = None):
+        self.storage = storage
+        self.flush_size = flush_size or settings.state_flush_size
+        self._cache: dict[str, Any] = {}
+        self._pending: dict[str, Any] = {}
+        self._unflushed = 0
+
+    async def refresh(self):
+        self._cache = await self.storage.retrieve_state()
+        self._cache.update(self._pending)
+
+    async def flush(self):
+        # taken before awaiting, so concurrent checkpoints go to the next flush
+        pending, self._pending = self._pending, {}
+        self._unflushed = 0
+        await self.storage.save_state(pending)
+
+    async def set_state(self, key: str, value: Entry):
+        serialized = serialize_entry(value)
+        self._cache[key] = serialized
+        self._pending[key] = serialized
+        self._unflushed += 1
+        if self._unflushed >= self.flush_size:
+            await self.flush()
+
+    def get_state(self, key: str) -> Entry:
+        return parse_entry(self._cache.get(key))
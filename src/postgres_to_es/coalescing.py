@@ -0,0 +1,37 @@
+from typing import Iterable
+from uuid import UUID
+
+from .models import Entry
+
+
+class DirtySet:
+    """
+    Ids of documents to rebuild collected during a cycle.
+
+    Every id is kept once, however many tables and enricher joins
+    pointed at it. Checkpoints of the batches the ids came from are kept
+    too and may be stored only after the documents are loaded.
+    """
+
+    def __init__(self):
+        self.ids: dict[UUID, Entry] = {}
+        self.checkpoints: list[tuple[str, Entry]] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, entries: Iterable[Entry]):
+        for entry in entries:
+            self.ids.setdefault(entry.id, entry)
+
+    def checkpoint(self, table: str, entry: Entry):
+        self.checkpoints.append((table, entry))
+
+    def chunks(self, size: int) -> Iterable[list[Entry]]:
+        entries = list(self.ids.values())
+        for start in range(0, len(entries), size):
+            yield entries[start : start + size]
+
+    def clear(self):
+        self.ids = {}
+        self.checkpoints = []
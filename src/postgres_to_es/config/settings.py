@@ -1,4 +1,9 @@
-from pydantic import BaseSettings
+from typing import Any
+
+from pydantic import BaseSettings, root_validator
+
+# rows deleted from the content tables, filled by triggers
+TOMBSTONE_TABLE = "content.etl_tombstone"
 
 
 class Settings(BaseSettings):
@@ -7,6 +12,26 @@ class Settings(BaseSettings):
     elastic_person_index: str = "persons"
     elastic_genre_index: str = "genres"
     elastic_pack_size: int = 1000
+    # "json" or "orjson", used for bulk bodies and state
+    json_serializer: str = "json"
+    # validate documents with pydantic models before loading
+    strict_validation: bool = False
+    # more than one worker sends bulk requests concurrently
+    elastic_bulk_workers: int = 1
+    elastic_bulk_chunk_size: int = 500
+    elastic_bulk_chunk_bytes: int = 10 * 1024 * 1024
+    # documents rejected with a retriable status are sent again on their own
+    bulk_item_retries: int = 3
+    # documents rejected for good are kept in "redis" stream or a "file"
+    # for replay.py instead of failing their batch; empty to fail it
+    dead_letters: str = ""
+    dead_letter_stream: str = "etl_dead_letters"
+    dead_letter_maxlen: int = 100000
+    dead_letter_file: str = "/tmp/etl_dead_letters.jsonl"
+    # keep the previous index after its alias moved to a rebuilt one
+    reindex_keep_old: bool = False
+    # redis set of indices with mappings out of date
+    reindex_flag_key: str = "etl_reindex"
 
     postgres_db: str
     postgres_user: str
@@ -17,6 +42,10 @@ class Settings(BaseSettings):
     redis_host: str
     redis_port: int
 
+    state_key: str = "etl_state:watermarks"
+    state_legacy_key: str = "etl_state"
+    state_flush_size: int = 100
+
     tables_for_scan: list[tuple[str, int]] = [
         ("content.genre", 1),
         ("content.person", 1000),
@@ -25,10 +54,109 @@ class Settings(BaseSettings):
         ("content.person_film_work", 1000),
     ]
 
+    # documents of deleted rows are deleted, the tombstone table is scanned
+    # after the tables above
+    propagate_deletes: bool = False
+    tombstone_install_triggers: bool = False
+    tombstone_pack_size: int = 1000
+    tombstone_retention_days: int = 30
+
+    # "sync" or "async"
+    etl_engine: str = "sync"
+    # table scans running at once with the async engine
+    async_concurrency: int = 4
+
+    shared_scan: bool = True
+    # names of persons and genres are updated in place in the documents
+    # embedding them instead of rebuilding those documents
+    partial_updates: bool = False
+    # assemble film documents from flat queries instead of one joined query
+    flat_film_merge: bool = False
+    # skip documents loaded with the same content before, hashes of them
+    # are kept "local" in the process or in "redis"; empty to load everything.
+    # Hashes of an index are dropped when the index is created or rebuilt,
+    # after emptying an index otherwise or resetting its watermarks delete
+    # its hashes by hand: `redis-cli DEL {hash_store_prefix}:{index}`
+    skip_unchanged: str = ""
+    hash_store_prefix: str = "etl_hashes"
+
+    # more than one shard lets several workers split the id space
+    shard_count: int = 1
+    shard_lease_ttl: int = 60
+    shard_lease_prefix: str = "etl_shard"
+    worker_id: str = ""
+    # run etl stages in separate threads connected with queues
+    pipelined: bool = False
+    pipeline_queue_size: int = 4
+    # load every affected document once per cycle, ignored when pipelined
+    coalesce: bool = False
+    coalesce_max_ids: int = 10000
+
+    # poll every index at an interval of its own, shorter while its tables
+    # change, and scan only the tables with rows after its watermarks
+    adaptive_schedule: bool = False
+    schedule_min_interval: float = 1
+    schedule_max_interval: float = 300
+
+    listen_notify: bool = False
+    notify_channel: str = "etl_changes"
+    notify_install_triggers: bool = False
+    # full scan if no notification came for that long
+    notify_fallback_interval: int = 60 * 30
+    notify_debounce: float = 0.5
+    notify_debounce_max: float = 5
+
+    # prometheus metrics are served on this port unless it's 0
+    metrics_port: int = 0
+    metrics_host: str = "0.0.0.0"
+
+    # cProfile stats of the cycles with these numbers and of these stages
+    # (enrich, merge, transform, load) are saved to profile_dir,
+    # only one of them can be profiled in a thread at a time, so cycles
+    # and stages aren't profiled together
+    profile_dir: str = "/tmp/etl_profiles"
+    profile_cycles: set[int] = set()
+    profile_stages: set[str] = set()
+    # log allocation peaks of enricher and merger batches
+    trace_allocations: bool = False
+
+    # batch sizes follow the measured latency and size of batches,
+    # initial sizes are the configured ones
+    adaptive_batching: bool = False
+    adaptive_min_size: int = 10
+    adaptive_max_size: int = 10000
+    adaptive_scan_seconds: float = 0.5
+    adaptive_merge_seconds: float = 1
+    adaptive_bulk_seconds: float = 2
+    # documents held by a merged batch
+    adaptive_batch_bytes: int = 16 * 1024 * 1024
+
+    # connections are kept open between cycles,
+    # pinged after this many idle seconds and replaced after the other
+    connection_check_idle: int = 30
+    connection_max_idle: int = 60 * 10
+
     wait_up_to: int = 60 * 60 * 12
-    waiting_interval: int = 60 * 30
-    waiting_factor: int = 2
-    first_nap: float = 0.1
+    # calls failed to connect are retried with random waits up to the
+    # exponential backoff, while both attempts and the deadline last
+    retry_attempts: int = 10
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 60
+    retry_deadline: float = 600
+    # calls given up in a row, each after all of its attempts, after which
+    # calls to a backend fail at once for the cooldown
+    breaker_threshold: int = 5
+    breaker_cooldown: float = 30
+
+    @root_validator(skip_on_failure=True)
+    def scan_tombstones(cls, values: dict[str, Any]) -> dict[str, Any]:
+        tables = values["tables_for_scan"]
+        if values["propagate_deletes"] and TOMBSTONE_TABLE not in dict(tables):
+            values["tables_for_scan"] = [
+                *tables,
+                (TOMBSTONE_TABLE, values["tombstone_pack_size"]),
+            ]
+        return values
 
 
 settings = Settings()  # type: ignore
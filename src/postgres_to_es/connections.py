@@ -1,21 +1,41 @@
 import logging
 from abc import ABC, abstractmethod
 from contextlib import closing
-from functools import wraps
-from time import sleep
+from functools import cache, partial, wraps
+from inspect import isgeneratorfunction
+from operator import attrgetter
+from time import monotonic, sleep
 from typing import Any, Callable, Iterable, Mapping, cast
 
 from elasticsearch import Elasticsearch, TransportError
-from elasticsearch.helpers import BulkIndexError, bulk
-from psycopg2 import OperationalError
+from elasticsearch.helpers import bulk, parallel_bulk
+from psycopg2 import InterfaceError, OperationalError
 from psycopg2 import connect as pg_connect
 from psycopg2.extensions import connection as pg_connection
-from psycopg2.extras import DictCursor, DictRow
+from psycopg2.extras import (
+    DictCursor,
+    DictRow,
+    register_default_json,
+    register_default_jsonb,
+)
 from redis import Redis
 from redis.exceptions import ConnectionError, RedisError
 
 from .config.settings import settings
-from .exceptions import ConnectionFailedError, DataInconsistentError
+from .exceptions import BulkError, ConnectionFailedError, DataInconsistentError
+from .retries import Retrying, connection_policy, get_breaker
+from .serializers import elastic_serializers, get_serializer
+
+CONNECTION_ERRORS = (
+    OperationalError,
+    InterfaceError,
+    TransportError,
+    ConnectionError,
+    RedisError,
+    OSError,
+)
+# seconds between polls of a long elasticsearch task
+TASK_POLL_INTERVAL = 5
 
 
 def get_cursor(connection: pg_connection) -> DictCursor:
@@ -23,8 +43,20 @@ def get_cursor(connection: pg_connection) -> DictCursor:
 
 
 class Connector(ABC):
+    """
+    Keeps one connection open between uses.
+
+    A connection idle for `connection_check_idle` seconds is pinged before
+    it's handed out again, the one idle for `connection_max_idle` seconds
+    is replaced.
+    """
+
+    # connectors of one backend share its circuit breaker
+    backend = ""
+
     def __init__(self):
         self.connection: Elasticsearch | pg_connection | Redis | None = None
+        self.last_used = 0.0
 
     @abstractmethod
     def _connect(self) -> Elasticsearch | pg_connection | Redis:
@@ -34,17 +66,49 @@ class Connector(ABC):
     def _ping(self):
         ...
 
+    def _stale(self) -> bool:
+        idle = monotonic() - self.last_used
+        if idle > settings.connection_max_idle:
+            logging.debug(f"Recycling connection idle for {idle:.0f} seconds")
+            return True
+        if idle > settings.connection_check_idle:
+            try:
+                self._ping()
+            except CONNECTION_ERRORS as e:
+                logging.debug(e)
+                return True
+        return False
+
     def connect(self) -> Elasticsearch | pg_connection | Redis:
+        if self.connection and self._stale():
+            self.close()
         if not self.connection:
             self.connection = self._connect()
+        self.last_used = monotonic()
         return self.connection
 
     def reconnect(self):
+        self.close()
         self.connection = self._connect()
+        self.last_used = monotonic()
         self._ping()
 
+    def release(self):
+        """The connection stays open for the next user"""
+
+    def close(self):
+        if not self.connection:
+            return
+        try:
+            self.connection.close()
+        except CONNECTION_ERRORS as e:
+            logging.debug(e)
+        self.connection = None
+
 
 class PostgresConnector(Connector):
+    backend = "postgres"
+
     def __init__(self, dsl: dict | None = None):
         super().__init__()
         if not dsl:
@@ -64,11 +128,22 @@ class PostgresConnector(Connector):
         cursor.execute("SELECT 1;")
         cursor.close()
 
+    def release(self):
+        # a long-lived connection must not stay idle in transaction
+        connection = cast(pg_connection | None, self.connection)
+        if connection and not connection.closed:
+            connection.rollback()
+
     def _connect(self) -> pg_connection:
-        return pg_connect(**self.dsl, cursor_factory=DictCursor)
+        connection = pg_connect(**self.dsl, cursor_factory=DictCursor)
+        register_default_json(connection, loads=get_serializer().loads)
+        register_default_jsonb(connection, loads=get_serializer().loads)
+        return connection
 
 
 class ElasticConnector(Connector):
+    backend = "elastic"
+
     def __init__(self, endpoint: str | None = None):
         super().__init__()
         if not endpoint:
@@ -82,10 +157,12 @@ class ElasticConnector(Connector):
             raise TransportError("No ping from ElasticSearch")
 
     def _connect(self) -> Elasticsearch:
-        return Elasticsearch(self.endpoint)
+        return Elasticsearch(self.endpoint, serializers=elastic_serializers())
 
 
 class RedisConnector(Connector):
+    backend = "redis"
+
     def __init__(self, host: str | None = None, port: int | None = None):
         super().__init__()
         if not host:
@@ -101,72 +178,77 @@ class RedisConnector(Connector):
         self.connection.ping()  # type: ignore
 
     def _connect(self) -> Redis:
-        return Redis(self.host, self.port, decode_responses=True)
+        return Redis(
+            self.host,
+            self.port,
+            decode_responses=True,
+            health_check_interval=settings.connection_check_idle,
+        )
 
 
 def backing_connect(connector: Connector) -> Callable:
+    """
+    Retries calls failed to reach the backend of the connector, reconnecting
+    before every next attempt. Generator functions are started over.
+    """
+
+    retrying = Retrying(
+        connection_policy(),
+        get_breaker(connector.backend),
+        CONNECTION_ERRORS,
+        connector.reconnect,
+    )
+
     def decorator(func: Callable):
-        @wraps(func)
-        def inner(*args, **kwargs):
-            wait = settings.first_nap
-            time_passed = 0
-            is_connected = True
-            while time_passed < settings.wait_up_to:
-                try:
-                    # trying to reconnect
-                    if not is_connected:
-                        connector.reconnect()  # type: ignore
-
-                    return func(*args, **kwargs)
-                except (
-                    OperationalError or TransportError or ConnectionError or RedisError
-                ) as e:
-                    logging.error(e)
-                    is_connected = False
-                    time_passed += wait
-                    wait = (
-                        wait * settings.waiting_factor
-                        if wait < settings.waiting_interval
-                        else settings.waiting_interval
-                    )
-                    logging.debug(f"Sleeping for {wait} seconds")
-                    sleep(wait)
-            raise ConnectionFailedError("Waiting for connection exceeded limit")
-
-        return inner
+        if isgeneratorfunction(func):
+            return wraps(func)(partial(retrying.iterate, func))
+        return wraps(func)(partial(retrying.call, func))
 
     return decorator
 
 
 class ConnectionManager:
-    def __init__(self, connector: Connector):
+    """
+    Access to the connection of a connector.
+
+    A manager of a `persistent` connector leaves the connection open on exit,
+    unless it exits with a connection failure.
+    """
+
+    def __init__(self, connector: Connector, persistent: bool = False):
         self.connector = connector
-        self._connection = None
+        self.persistent = persistent
 
     def back_connection(self) -> Callable:
         return backing_connect(self.connector)
 
     def get_connection(self) -> pg_connection | Redis | Elasticsearch:
-        if self._connection:
-            return self._connection
-
-        self._connection = self.back_connection()(self.connector.connect)()
-        return self._connection
+        # always the current one, the connector replaces it on reconnect
+        return self.back_connection()(self.connector.connect)()
 
     @property
     def connection(self) -> pg_connection | Redis | Elasticsearch | None:
         return self.get_connection()
 
-    @connection.setter
-    def connection(self, connection: pg_connection | Redis | Elasticsearch | None):
-        self._connection = connection
+    def _call(self, method: str, *args, **kwargs) -> Any:
+        return attrgetter(method)(self.connector.connect())(*args, **kwargs)
 
-    def __exit__(self, *args):
-        if not self._connection:
+    def call(self, method: str, *args, **kwargs) -> Any:
+        """
+        A method of the connection with reconnect, looked up on every attempt,
+        so a retry doesn't go to the connection replaced by the reconnect.
+        The name may be dotted, like `indices.get`.
+        """
+
+        return self.back_connection()(self._call)(method, *args, **kwargs)
+
+    def __exit__(self, exc_type, exc, traceback):
+        failed = isinstance(exc, CONNECTION_ERRORS + (ConnectionFailedError,))
+        if self.persistent and not failed:
+            self.connector.release()
             return
 
-        self._connection.close()
-        self._connection = None  # type: ignore
+        self.connector.close()
         logging.debug("Closed connection")
 
     def __enter__(self):
@@ -174,17 +256,17 @@ class ConnectionManager:
 
 
 class RedisConnectionManager(ConnectionManager):
-    def __init__(self, connector: RedisConnector):
-        super().__init__(connector)
+    def __init__(self, connector: RedisConnector, persistent: bool = False):
+        super().__init__(connector, persistent)
 
     def get_connection(self) -> Redis:
         return cast(Redis, super().get_connection())
 
 
 class PostgresConnectionManager(ConnectionManager):
-    def __init__(self, connector: PostgresConnector):
+    def __init__(self, connector: PostgresConnector, persistent: bool = False):
         self.cursor_name_prefix = 1
-        super().__init__(connector)
+        super().__init__(connector, persistent)
 
     def get_connection(self) -> pg_connection:
         return cast(pg_connection, super().get_connection())
@@ -195,12 +277,10 @@ class PostgresConnectionManager(ConnectionManager):
             self.cursor_name_prefix = 1
 
         if itersize < 1:
-            return self.back_connection()(self.get_connection().cursor)()
+            return self.call("cursor")
 
         # create server side cursor to limit memory use
-        cursor = self.back_connection()(self.get_connection().cursor)(
-            name=f"cursor_{self.cursor_name_prefix}"
-        )
+        cursor = self.call("cursor", name=f"cursor_{self.cursor_name_prefix}")
 
         self.cursor_name_prefix += 1
 
@@ -217,12 +297,14 @@ class PostgresConnectionManager(ConnectionManager):
             cursor.execute(sql, sql_vars)
         return cursor
 
-    def _fetchall(self, sql: str, sql_vars: Any = None) -> Iterable[DictRow]:
+    def _fetchall(
+        self, sql: str, sql_vars: Any = None, itersize: int = 0
+    ) -> Iterable[DictRow]:
         """
         cursor.fetchall() with reconnect
         """
 
-        with closing(self.cursor()) as cursor:
+        with closing(self.cursor(itersize)) as cursor:
             return self._execute(cursor, sql, sql_vars).fetchall()
 
     def _fetchone(self, sql, sql_vars: Any = None, itersize: int = 1) -> DictRow | None:
@@ -262,7 +344,9 @@ class PostgresConnectionManager(ConnectionManager):
 
     def fetchmany(self, sql: str, size: int, sql_vars: Any = None, itersize: int = 0):
         """
-        cursor.fetchmany with reconnect and batch control
+        cursor.fetchmany with reconnect and batch control,
+        a query failed while reading is run again and its rows are read
+        from the start, so callers must tolerate repeated rows
 
         sql: str - SQL expression
         size: int - number of rows to read
@@ -276,19 +360,114 @@ class PostgresConnectionManager(ConnectionManager):
 
 
 class ElasticConnectionManager(ConnectionManager):
-    def __init__(self, connector: ElasticConnector):
-        super().__init__(connector)
+    def __init__(self, connector: ElasticConnector, persistent: bool = False):
+        super().__init__(connector, persistent)
 
     def get_connection(self) -> Elasticsearch:
         return cast(Elasticsearch, super().get_connection())
 
-    def bulk(self, operations: Iterable[Mapping[str, Any]]):
-        try:
-            rows_count, errors = self.back_connection()(bulk)(
-                self.connection, operations
-            )
-            logging.debug(f"Persisted {rows_count} entries")
-            logging.debug(f"Persisted with errors: {errors}")
-        except BulkIndexError as e:
-            logging.error(e.errors)
-            raise DataInconsistentError(e)
+    def _task(self, task_id: str) -> dict[str, Any]:
+        return self.call("tasks.get", task_id=task_id).body
+
+    def wait_for_task(self, task_id: str) -> dict[str, Any]:
+        """
+        Response of a task started with `wait_for_completion=False`.
+        Only the polls are retried, a long task doesn't run into
+        the request timeout and isn't started again.
+        """
+
+        while True:
+            task = self._task(task_id)
+            if task.get("completed"):
+                break
+            sleep(TASK_POLL_INTERVAL)
+        if task.get("error"):
+            raise DataInconsistentError(f"Task {task_id} failed: {task['error']}")
+        return task.get("response", {})
+
+    def _bulk(
+        self, operations: Iterable[Mapping[str, Any]], chunk_size: int
+    ) -> tuple[int, list]:
+        # every chunk is sent, errors of all of them are collected
+        return bulk(
+            self.connector.connect(),
+            operations,
+            chunk_size=chunk_size,
+            max_chunk_bytes=settings.elastic_bulk_chunk_bytes,
+            raise_on_error=False,
+            # a chunk answered with an error status fails its items alone
+            raise_on_exception=False,
+        )
+
+    def bulk(self, operations: Iterable[Mapping[str, Any]], chunk_size: int = 500):
+        rows_count, errors = self.back_connection()(self._bulk)(operations, chunk_size)
+        logging.debug(f"Persisted {rows_count} entries")
+        if errors:
+            logging.error(errors)
+            raise BulkError(f"Failed to persist {len(errors)} entries", errors)
+
+    def _parallel_bulk(
+        self, operations: Iterable[Mapping[str, Any]], chunk_size: int
+    ) -> int:
+        rows_count, errors = 0, []
+        for ok, item in parallel_bulk(
+            self.connector.connect(),
+            operations,
+            thread_count=settings.elastic_bulk_workers,
+            chunk_size=chunk_size,
+            max_chunk_bytes=settings.elastic_bulk_chunk_bytes,
+            queue_size=settings.elastic_bulk_workers,
+            raise_on_error=False,
+            raise_on_exception=False,
+        ):
+            if ok:
+                rows_count += 1
+                continue
+            logging.error(f"Failed to persist entry: {item}")
+            errors.append(item)
+
+        logging.debug(f"Persisted {rows_count} entries")
+        if errors:
+            raise BulkError(f"Failed to persist {len(errors)} entries", errors)
+        return rows_count
+
+    def parallel_bulk(
+        self, operations: Iterable[Mapping[str, Any]], chunk_size: int | None = None
+    ):
+        """
+        Sends operations with several concurrent bulk requests.
+        Every request is limited by the number of operations and by its size.
+        """
+
+        self.back_connection()(self._parallel_bulk)(
+            operations, chunk_size or settings.elastic_bulk_chunk_size
+        )
+
+
+class ConnectionPool:
+    """Connectors shared by every manager for the whole life of the process"""
+
+    def __init__(self):
+        self.elastic = ElasticConnector()
+        self.postgres = PostgresConnector()
+        self.redis = RedisConnector()
+
+    def managers(
+        self,
+    ) -> tuple[
+        ElasticConnectionManager, PostgresConnectionManager, RedisConnectionManager
+    ]:
+        return (
+            ElasticConnectionManager(self.elastic, persistent=True),
+            PostgresConnectionManager(self.postgres, persistent=True),
+            RedisConnectionManager(self.redis, persistent=True),
+        )
+
+    def close(self):
+        for connector in (self.elastic, self.postgres, self.redis):
+            connector.close()
+
+
+@cache
+def get_pool() -> ConnectionPool:
+    return ConnectionPool()
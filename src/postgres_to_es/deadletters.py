@@ -0,0 +1,161 @@
+import fcntl
+import json
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Any, Iterable, Iterator, Mapping
+from uuid import uuid4
+
+from pydantic import BaseModel
+
+from .config.settings import settings
+from .connections import RedisConnectionManager
+from .exceptions import ConfigurationError
+
+# item statuses of bulk responses worth sending again
+RETRIABLE_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class DeadLetter(BaseModel):
+    """A document elasticsearch refused to take"""
+
+    index: str
+    id: str
+    status: int | str
+    error: Any
+    failed_at: datetime
+
+
+def bulk_error_item(error: Mapping[str, Any]) -> dict[str, Any]:
+    """Result of the operation from an error of the bulk helpers"""
+
+    ((_, item),) = error.items()
+    return item
+
+
+def error_status(error: Mapping[str, Any]) -> int | str:
+    return bulk_error_item(error).get("status", "N/A")
+
+
+def is_deleted_already(error: Mapping[str, Any]) -> bool:
+    ((operation, item),) = error.items()
+    return operation == "delete" and item.get("status") == 404
+
+
+def dead_letter(index_name: str, error: Mapping[str, Any]) -> DeadLetter:
+    item = bulk_error_item(error)
+    return DeadLetter(
+        index=index_name,
+        id=str(item.get("_id")),
+        status=item.get("status", "N/A"),
+        error=item.get("error") or item.get("exception"),
+        failed_at=datetime.utcnow(),
+    )
+
+
+class DeadLetterStore(ABC):
+    """Documents left out of loading until they are replayed"""
+
+    @abstractmethod
+    def add(self, letters: Iterable[DeadLetter]):
+        ...
+
+    @abstractmethod
+    def read(self, count: int | None = None) -> list[tuple[str, DeadLetter]]:
+        """The oldest letters with the keys to remove them by"""
+
+    @abstractmethod
+    def remove(self, keys: Iterable[str]):
+        ...
+
+
+class RedisDeadLetterStore(DeadLetterStore):
+    """A redis stream trimmed to `dead_letter_maxlen` entries"""
+
+    def __init__(self, conn_mann: RedisConnectionManager):
+        self.conn_mann = conn_mann
+        self.key = settings.dead_letter_stream
+
+    def add(self, letters: Iterable[DeadLetter]):
+        for letter in letters:
+            self.conn_mann.call(
+                "xadd",
+                self.key,
+                {"letter": letter.json()},
+                maxlen=settings.dead_letter_maxlen,
+                approximate=True,
+            )
+
+    def read(self, count: int | None = None) -> list[tuple[str, DeadLetter]]:
+        entries = self.conn_mann.call("xrange", self.key, count=count)
+        return [
+            (key, DeadLetter.parse_raw(fields["letter"])) for key, fields in entries
+        ]
+
+    def remove(self, keys: Iterable[str]):
+        keys = list(keys)
+        if keys:
+            self.conn_mann.call("xdel", self.key, *keys)
+
+
+class FileDeadLetterStore(DeadLetterStore):
+    """
+    Lines of json in a local file. Replay runs in its own process beside
+    the etl, so every change is made under a lock of a file next to it.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(f"{self.path.name}.lock")
+        self.lock = Lock()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.lock_path.open("a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _lines(self) -> list[dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        with self.path.open() as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    def add(self, letters: Iterable[DeadLetter]):
+        lines = [
+            json.dumps({"key": uuid4().hex, "letter": json.loads(letter.json())})
+            for letter in letters
+        ]
+        with self._locked(), self.path.open("a") as file:
+            file.writelines(f"{line}\n" for line in lines)
+
+    def read(self, count: int | None = None) -> list[tuple[str, DeadLetter]]:
+        with self._locked():
+            lines = self._lines()[:count]
+        return [(line["key"], DeadLetter.parse_obj(line["letter"])) for line in lines]
+
+    def remove(self, keys: Iterable[str]):
+        keys = set(keys)
+        with self._locked():
+            kept = [line for line in self._lines() if line["key"] not in keys]
+            rewritten = self.path.with_name(f"{self.path.name}.tmp")
+            with rewritten.open("w") as file:
+                file.writelines(f"{json.dumps(line)}\n" for line in kept)
+            rewritten.replace(self.path)
+
+
+def create_dead_letter_store(redis: RedisConnectionManager) -> DeadLetterStore | None:
+    if not settings.dead_letters:
+        return None
+    if settings.dead_letters == "redis":
+        return RedisDeadLetterStore(redis)
+    if settings.dead_letters == "file":
+        return FileDeadLetterStore(settings.dead_letter_file)
+    raise ConfigurationError(f"Unknown dead letter store {settings.dead_letters}")
@@ -23,6 +23,7 @@ class Enricher(ABC):
 def enrich(
     manager: PostgresConnectionManager, sql, pack_size, vals
 ) -> Iterable[Iterable[Entry]]:
+    # a retried query repeats ids, their documents are just loaded again
     for rows in manager.fetchmany(sql, pack_size, sql_vars=(vals,), itersize=5000):
         if not rows:
             break
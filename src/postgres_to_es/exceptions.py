@@ -6,5 +6,19 @@ class DataInconsistentError(Error):
     ...
 
 
+class BulkError(DataInconsistentError):
+    def __init__(self, message: str, errors: list):
+        super().__init__(message)
+        self.errors = errors
+
+
 class ConnectionFailedError(Error):
     ...
+
+
+class CircuitOpenError(ConnectionFailedError):
+    ...
+
+
+class ConfigurationError(Error):
+    ...
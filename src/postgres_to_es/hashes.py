@@ -0,0 +1,122 @@
+import hashlib
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from functools import cache
+from typing import Any, Iterable, Mapping
+
+import orjson
+
+from .config.settings import settings
+from .connections import RedisConnectionManager
+from .exceptions import ConfigurationError
+from .serializers import default
+
+
+def document_hash(document: Mapping[str, Any]) -> str:
+    """Same for equal documents whatever the order of their keys"""
+
+    serialized = orjson.dumps(
+        document, default=default, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    )
+    return hashlib.blake2b(serialized, digest_size=8).hexdigest()
+
+
+class HashStore(ABC):
+    """Hashes of the documents last loaded to every index"""
+
+    @abstractmethod
+    def get_many(self, index_name: str, ids: list[str]) -> list[str | None]:
+        ...
+
+    @abstractmethod
+    def set_many(self, index_name: str, hashes: Mapping[str, str]):
+        ...
+
+    @abstractmethod
+    def delete_many(self, index_name: str, ids: Iterable[str]):
+        ...
+
+    @abstractmethod
+    def clear(self, index_name: str):
+        ...
+
+    @abstractmethod
+    def move(self, source: str, target: str):
+        """Hashes of the source index replace those of the target"""
+
+
+class LocalHashStore(HashStore):
+    """Lives as long as the process, digests are kept as ints"""
+
+    def __init__(self):
+        self.hashes: dict[str, dict[str, int]] = defaultdict(dict)
+
+    def get_many(self, index_name: str, ids: list[str]) -> list[str | None]:
+        stored = self.hashes[index_name]
+        return [f"{stored[id_]:016x}" if id_ in stored else None for id_ in ids]
+
+    def set_many(self, index_name: str, hashes: Mapping[str, str]):
+        self.hashes[index_name].update(
+            (id_, int(digest, 16)) for id_, digest in hashes.items()
+        )
+
+    def delete_many(self, index_name: str, ids: Iterable[str]):
+        stored = self.hashes[index_name]
+        for id_ in ids:
+            stored.pop(id_, None)
+
+    def clear(self, index_name: str):
+        self.hashes.pop(index_name, None)
+
+    def move(self, source: str, target: str):
+        self.hashes[target] = self.hashes.pop(source, {})
+
+
+class RedisHashStore(HashStore):
+    """A redis hash of document ids per index, shared by workers"""
+
+    def __init__(self, conn_mann: RedisConnectionManager):
+        self.conn_mann = conn_mann
+
+    def _key(self, index_name: str) -> str:
+        return f"{settings.hash_store_prefix}:{index_name}"
+
+    def get_many(self, index_name: str, ids: list[str]) -> list[str | None]:
+        if not ids:
+            return []
+        return self.conn_mann.call("hmget", self._key(index_name), ids)
+
+    def set_many(self, index_name: str, hashes: Mapping[str, str]):
+        if not hashes:
+            return
+        self.conn_mann.call("hset", self._key(index_name), mapping=hashes)
+
+    def delete_many(self, index_name: str, ids: Iterable[str]):
+        ids = list(ids)
+        if not ids:
+            return
+        self.conn_mann.call("hdel", self._key(index_name), *ids)
+
+    def clear(self, index_name: str):
+        self.conn_mann.call("delete", self._key(index_name))
+
+    def move(self, source: str, target: str):
+        if self.conn_mann.call("exists", self._key(source)):
+            self.conn_mann.call("rename", self._key(source), self._key(target))
+        else:
+            self.clear(target)
+
+
+@cache
+def local_hash_store() -> LocalHashStore:
+    return LocalHashStore()
+
+
+def create_hash_store(redis: RedisConnectionManager) -> HashStore | None:
+    if not settings.skip_unchanged:
+        return None
+    if settings.skip_unchanged == "local":
+        return local_hash_store()
+    if settings.skip_unchanged == "redis":
+        return RedisHashStore(redis)
+    raise ConfigurationError(f"Unknown hash store {settings.skip_unchanged}")
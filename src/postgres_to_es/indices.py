@@ -0,0 +1,186 @@
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from typing import Any
+
+from elasticsearch import NotFoundError
+
+from .config.settings import settings
+from .connections import ElasticConnectionManager, RedisConnectionManager
+from .hashes import create_hash_store
+
+ANALYSIS = {
+    "filter": {
+        "english_stop": {"type": "stop", "stopwords": "_english_"},
+        "english_stemmer": {"type": "stemmer", "language": "english"},
+        "english_possessive_stemmer": {
+            "type": "stemmer",
+            "language": "possessive_english",
+        },
+        "russian_stop": {"type": "stop", "stopwords": "_russian_"},
+        "russian_stemmer": {"type": "stemmer", "language": "russian"},
+    },
+    "analyzer": {
+        "ru_en": {
+            "tokenizer": "standard",
+            "filter": [
+                "lowercase",
+                "english_stop",
+                "english_stemmer",
+                "english_possessive_stemmer",
+                "russian_stop",
+                "russian_stemmer",
+            ],
+        }
+    },
+}
+
+RU_EN_TEXT = {"type": "text", "analyzer": "ru_en"}
+
+
+def nested(properties: dict[str, Any]) -> dict[str, Any]:
+    return {"type": "nested", "dynamic": "strict", "properties": properties}
+
+
+PERSON_REF = nested({"id": {"type": "keyword"}, "full_name": RU_EN_TEXT})
+
+MOVIES_MAPPINGS = {
+    "dynamic": "strict",
+    "properties": {
+        "id": {"type": "keyword"},
+        "imdb_rating": {"type": "float"},
+        "genre": {"type": "keyword"},
+        "title": {**RU_EN_TEXT, "fields": {"raw": {"type": "keyword"}}},
+        "description": RU_EN_TEXT,
+        "director": {"type": "text"},
+        "actors_names": {"type": "text"},
+        "writers_names": {"type": "text"},
+        "actors": PERSON_REF,
+        "directors": PERSON_REF,
+        "writers": PERSON_REF,
+        "genres": nested({"id": {"type": "keyword"}, "name": {"type": "keyword"}}),
+    },
+}
+
+GENRES_MAPPINGS = {
+    "dynamic": "strict",
+    "properties": {
+        "id": {"type": "keyword"},
+        "name": RU_EN_TEXT,
+        "description": RU_EN_TEXT,
+    },
+}
+
+PERSONS_MAPPINGS = {
+    "dynamic": "strict",
+    "properties": {"id": {"type": "keyword"}, "full_name": RU_EN_TEXT},
+}
+
+
+def fingerprint(mappings: dict[str, Any]) -> str:
+    definition = {"analysis": ANALYSIS, "mappings": mappings}
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode()).hexdigest()
+
+
+def definitions() -> dict[str, dict[str, Any]]:
+    """Mappings of every index, stamped with their fingerprint"""
+
+    indices = {
+        settings.elastic_movie_index: MOVIES_MAPPINGS,
+        settings.elastic_genre_index: GENRES_MAPPINGS,
+        settings.elastic_person_index: PERSONS_MAPPINGS,
+    }
+    return {
+        name: {**deepcopy(mappings), "_meta": {"fingerprint": fingerprint(mappings)}}
+        for name, mappings in indices.items()
+    }
+
+
+class IndexBootstrap:
+    """
+    Creates missing indices and checks the existing ones.
+
+    The fingerprint of the definition is kept in `_meta` of the mappings,
+    an index with a different fingerprint is flagged for reindex.
+    """
+
+    def __init__(
+        self, elastic: ElasticConnectionManager, redis: RedisConnectionManager
+    ):
+        self.elastic = elastic
+        self.redis = redis
+
+    def _stored_mappings(self, name: str) -> dict[str, Any] | None:
+        try:
+            found = self.elastic.call("indices.get_mapping", index=name)
+        except NotFoundError:
+            return None
+        # the alias may point to a versioned index
+        (definition,) = found.body.values()
+        return definition["mappings"]
+
+    def create(self, name: str, mappings: dict[str, Any]):
+        self.elastic.call(
+            "indices.create",
+            index=name,
+            settings={"refresh_interval": "1s", "analysis": ANALYSIS},
+            mappings=mappings,
+        )
+        logging.info(f"Index {name} created")
+        if hashes := create_hash_store(self.redis):
+            # documents hashed for a former index with the name are gone
+            hashes.clear(name)
+
+    def ensure(self, name: str, mappings: dict[str, Any]) -> bool:
+        """False if the index has to be rebuilt"""
+
+        stored = self._stored_mappings(name)
+        if stored is None:
+            self.create(name, mappings)
+            return True
+
+        expected = mappings["_meta"]["fingerprint"]
+        actual = stored.get("_meta", {}).get("fingerprint")
+        if actual == expected:
+            logging.debug(f"Index {name} is up to date")
+            return True
+
+        if actual is None and stored == {
+            key: value for key, value in mappings.items() if key != "_meta"
+        }:
+            # created before fingerprints, only the stamp is missing
+            self.elastic.call("indices.put_mapping", index=name, meta=mappings["_meta"])
+            logging.info(f"Index {name} stamped with its fingerprint")
+            return True
+
+        logging.warning(f"Mappings of {name} differ from the definition")
+        return False
+
+    def flag(self, name: str):
+        self.redis.call("sadd", settings.reindex_flag_key, name)
+        logging.warning(f"Index {name} flagged for reindex")
+
+    def run(self) -> list[str]:
+        """Applies every definition concurrently, returns flagged indices"""
+
+        indices = definitions()
+        with ThreadPoolExecutor(max_workers=len(indices)) as executor:
+            futures = {
+                name: executor.submit(self.ensure, name, mappings)
+                for name, mappings in indices.items()
+            }
+
+        flagged = [name for name, future in futures.items() if not future.result()]
+        for name in flagged:
+            self.flag(name)
+        return flagged
+
+
+def flagged_indices(redis: RedisConnectionManager) -> set[str]:
+    return redis.call("smembers", settings.reindex_flag_key)
+
+
+def unflag(redis: RedisConnectionManager, name: str):
+    redis.call("srem", settings.reindex_flag_key, name)
@@ -1,7 +1,23 @@
+import logging
 from abc import ABC, abstractmethod
+from time import monotonic, sleep
 from typing import Any, Iterable, Mapping
 
+from . import metrics
+from .config.settings import settings
 from .connections import ConnectionManager, ElasticConnectionManager
+from .deadletters import (
+    RETRIABLE_STATUSES,
+    DeadLetterStore,
+    bulk_error_item,
+    dead_letter,
+    error_status,
+    is_deleted_already,
+)
+from .exceptions import BulkError
+from .hashes import HashStore, document_hash
+from .retries import bulk_item_policy
+from .tuning import estimate_bytes, get_tuner
 
 
 class Loader(ABC):
@@ -14,10 +30,118 @@ class Loader(ABC):
 
 
 class ElasticLoader(Loader):
-    def __init__(self, manager: ElasticConnectionManager, index_name: str):
+    def __init__(
+        self,
+        manager: ElasticConnectionManager,
+        index_name: str,
+        hashes: HashStore | None = None,
+        dead_letters: DeadLetterStore | None = None,
+    ):
         super().__init__(manager)
         self.manager = manager
         self.index_name = index_name
+        # documents loaded with the same content are skipped
+        self.hashes = hashes
+        # documents rejected for good are put aside there, not failing a batch
+        self.dead_letters = dead_letters
+
+    def _changed(
+        self, items: Iterable[Mapping[str, Any]]
+    ) -> tuple[list[Mapping[str, Any]], dict[str, str]]:
+        """Documents differing from their last loaded version and new hashes"""
+
+        items = list(items)
+        digests = [document_hash(item) for item in items]
+        stored = self.hashes.get_many(  # type: ignore
+            self.index_name, [str(item["id"]) for item in items]
+        )
+        changed, hashes = [], {}
+        for item, digest, last in zip(items, digests, stored):
+            if digest != last:
+                changed.append(item)
+                hashes[str(item["id"])] = digest
+
+        skipped = len(items) - len(changed)
+        if skipped:
+            metrics.DOCUMENTS_SKIPPED.labels(self.index_name).inc(skipped)
+            logging.debug(f"Skipped {skipped} unchanged documents of {self.index_name}")
+        return changed, hashes
+
+    def forget(self, ids: Iterable[str]):
+        """Documents were changed bypassing the loader"""
+
+        if self.hashes:
+            self.hashes.delete_many(self.index_name, ids)
+
+    def _send(self, operations: list[Mapping[str, Any]], chunk_size: int):
+        if settings.elastic_bulk_workers > 1:
+            self.manager.parallel_bulk(operations, chunk_size)
+        else:
+            self.manager.bulk(operations, chunk_size)
+
+    def _bulk(
+        self, operations: list[Mapping[str, Any]], chunk_size: int
+    ) -> list[Mapping[str, Any]]:
+        """
+        Sends the operations, then only those rejected with a retriable
+        status, and returns errors of the operations rejected for good
+        """
+
+        failed: list[Mapping[str, Any]] = []
+        delays = bulk_item_policy().delays()
+        while True:
+            try:
+                self._send(operations, chunk_size)
+                return failed
+            except BulkError as e:
+                metrics.BULK_ERRORS.labels(self.index_name).inc(len(e.errors))
+                retriable = self._partition(e.errors, failed)
+                operations = self._to_retry(operations, retriable)
+            if not operations:
+                return failed
+
+            delay = next(delays, None)
+            if delay is None:
+                raise BulkError(
+                    f"{len(operations)} entries of {self.index_name} "
+                    "are still rejected",
+                    failed + retriable,
+                )
+            logging.debug(f"Resending {len(operations)} entries in {delay:.2f}s")
+            sleep(delay)
+
+    def _partition(
+        self, errors: list[Mapping[str, Any]], failed: list[Mapping[str, Any]]
+    ) -> list[Mapping[str, Any]]:
+        """Errors worth retrying, the rest is added to the failed ones"""
+
+        retriable = []
+        for error in errors:
+            if is_deleted_already(error):
+                continue
+            if error_status(error) in RETRIABLE_STATUSES:
+                retriable.append(error)
+            else:
+                failed.append(error)
+        return retriable
+
+    def _to_retry(
+        self, operations: list[Mapping[str, Any]], errors: list[Mapping[str, Any]]
+    ) -> list[Mapping[str, Any]]:
+        rejected = {str(bulk_error_item(error).get("_id")) for error in errors}
+        return [
+            operation for operation in operations if str(operation["_id"]) in rejected
+        ]
+
+    def _dead_letter(self, errors: list[Mapping[str, Any]]):
+        if not self.dead_letters:
+            raise BulkError(f"Failed to persist {len(errors)} entries", errors)
+
+        self.dead_letters.add(dead_letter(self.index_name, error) for error in errors)
+        metrics.DEAD_LETTERS.labels(self.index_name).inc(len(errors))
+        logging.warning(
+            f"{len(errors)} documents of {self.index_name} sent to dead letters"
+        )
 
     def _prepare_operations(self, items: Iterable[Mapping[str, Any]]):
         return [
@@ -26,5 +150,52 @@ class ElasticLoader(Loader):
         ]
 
     def load(self, items: Iterable[Mapping[str, Any]]):
+        hashes: dict[str, str] = {}
+        if self.hashes:
+            items, hashes = self._changed(items)
         operations = self._prepare_operations(items)
-        self.manager.bulk(operations)
+        if not operations:
+            return
+        tuner = get_tuner(
+            f"bulk:{self.index_name}",
+            settings.elastic_bulk_chunk_size,
+            settings.adaptive_bulk_seconds,
+            settings.elastic_bulk_chunk_bytes,
+        )
+
+        nbytes = estimate_bytes(operations)
+        metrics.BULK_ITEMS.labels(self.index_name).inc(len(operations))
+        metrics.BULK_BYTES.labels(self.index_name).inc(nbytes)
+
+        started = monotonic()
+        failed = self._bulk(operations, tuner.size)
+        # concurrent requests share the time
+        elapsed = (monotonic() - started) * settings.elastic_bulk_workers
+        tuner.observe(len(operations), elapsed, nbytes)
+        if failed:
+            self._dead_letter(failed)
+            for error in failed:
+                hashes.pop(str(bulk_error_item(error).get("_id")), None)
+        if self.hashes:
+            # only what has surely been loaded
+            self.hashes.set_many(self.index_name, hashes)
+
+    def delete(self, ids: Iterable[str]):
+        """Documents of deleted rows"""
+
+        ids = [str(id_) for id_ in ids]
+        if not ids:
+            return
+        operations: list[Mapping[str, Any]] = [
+            {"_op_type": "delete", "_index": self.index_name, "_id": id_} for id_ in ids
+        ]
+        metrics.BULK_ITEMS.labels(self.index_name).inc(len(operations))
+        failed = self._bulk(operations, settings.elastic_bulk_chunk_size)
+        metrics.DOCUMENTS_DELETED.labels(self.index_name).inc(
+            len(operations) - len(failed)
+        )
+        if failed:
+            self._dead_letter(failed)
+        if self.hashes:
+            # a row restored with the same content is loaded again
+            self.hashes.delete_many(self.index_name, ids)
@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from collections import defaultdict
+from time import monotonic
 from typing import Iterable
 
 from psycopg2.extras import DictRow
@@ -7,6 +9,7 @@ from pydantic import BaseModel
 from .config.settings import settings
 from .connections import ConnectionManager, PostgresConnectionManager
 from .models import Entry, FilmWorkDocument, GenreDocument, PersonDocument
+from .tuning import estimate_bytes, get_tuner
 
 
 class Merger(ABC):
@@ -20,16 +23,26 @@ class Merger(ABC):
 
 class PostgresMerger(Merger, ABC):
     sql: str
+    model: type[BaseModel]
 
     def __init__(self, manager: PostgresConnectionManager):
         self.manager = manager
         self._sql = self.__class__.sql
+        # columns of the query go in the order of the model fields
+        self.fields = tuple(self.model.__fields__)
 
-    @abstractmethod
-    def transform_to_entries(
-        self, rows: Iterable[DictRow]
-    ) -> Iterable[FilmWorkDocument]:
-        ...
+    def transform_to_entries(self, rows: Iterable[DictRow]) -> Iterable:
+        """
+        Documents as plain dicts, or validated models in strict mode
+        """
+
+        if settings.strict_validation:
+            return (self.model.parse_obj(dict(zip(self.fields, row))) for row in rows)
+        return (dict(zip(self.fields, row)) for row in rows)
+
+    def fetch(self, ids: tuple[str, ...]) -> list:
+        rows = self.manager.fetchall(self._sql, sql_vars=(ids,))
+        return list(self.transform_to_entries(rows))
 
     def merge(self, entries: Iterable[Entry]) -> Iterable[Iterable[FilmWorkDocument]]:
         vals = tuple(str(entry.id) for entry in entries)
@@ -37,18 +50,29 @@ class PostgresMerger(Merger, ABC):
         if not vals:
             return ()
 
-        for rows in self.manager.fetchmany(
-            self._sql, settings.elastic_pack_size, sql_vars=(vals,)
-        ):
-            if not rows:
-                break
+        tuner = get_tuner(
+            f"merge:{type(self).__name__}",
+            settings.elastic_pack_size,
+            settings.adaptive_merge_seconds,
+            settings.adaptive_batch_bytes,
+        )
+        # documents are fetched by chunks of ids of the tuned size
+        while vals:
+            chunk, vals = vals[: tuner.size], vals[tuner.size :]
+            started = monotonic()
+            documents = self.fetch(chunk)
+            elapsed = monotonic() - started
+            if not documents:
+                continue
 
-            rows = self.transform_to_entries(rows)
+            nbytes = estimate_bytes(documents) if settings.adaptive_batching else 0
+            tuner.observe(len(chunk), elapsed, nbytes)
 
-            yield rows
+            yield documents
 
 
 class FilmWorkPostgresMerger(PostgresMerger):
+    model = FilmWorkDocument
     sql = (
         "SELECT fw.id, fw.title, fw.description, fw.rating,"
         "array_agg(DISTINCT g.name) as genre, "
@@ -93,61 +117,105 @@ class FilmWorkPostgresMerger(PostgresMerger):
         "WHERE fw.id in %s GROUP BY fw.id ORDER BY fw.modified ASC ;"
     )
 
-    def transform_to_entries(self, rows: Iterable[DictRow]) -> Iterable[BaseModel]:
-        entries = (
-            FilmWorkDocument.parse_obj(
-                {
-                    field.lower(): value
-                    for field, value in zip(
-                        FilmWorkDocument.schema()["properties"].keys(), row  # type: ignore
-                    )
-                }
-            )
-            for row in rows
-        )
 
-        return entries
+class FlatFilmWorkPostgresMerger(FilmWorkPostgresMerger):
+    """
+    Reads films, their persons and their genres with three plain queries
+    and puts documents together in python, so the database doesn't
+    multiply persons by genres of every film.
+
+    Lists are deduplicated and come in the order the DISTINCT aggregates
+    of the joined query sort them in: the database orders the rows with
+    its collation, python keeps that order. Objects are sorted as jsonb
+    is, by their shorter "id" key first.
+    """
+
+    films_sql = (
+        "SELECT fw.id, fw.title, fw.description, fw.rating "
+        "FROM content.film_work fw "
+        "WHERE fw.id in %s ORDER BY fw.modified ASC;"
+    )
+    persons_sql = (
+        "SELECT pfw.film_work_id, pfw.role, p.id, p.full_name "
+        "FROM content.person_film_work pfw "
+        "JOIN content.person p ON p.id = pfw.person_id "
+        "WHERE pfw.film_work_id in %s ORDER BY p.id::text, p.full_name;"
+    )
+    genres_sql = (
+        "SELECT gfw.film_work_id, g.id, g.name, "
+        "dense_rank() OVER (PARTITION BY gfw.film_work_id ORDER BY g.name) "
+        "FROM content.genre_film_work gfw "
+        "JOIN content.genre g ON g.id = gfw.genre_id "
+        "WHERE gfw.film_work_id in %s ORDER BY g.id::text, g.name;"
+    )
+    roles = ("actor", "director", "writer")
+
+    def _persons(self, ids: tuple[str, ...]) -> dict[tuple[str, str], dict]:
+        persons: dict[tuple[str, str], dict] = defaultdict(dict)
+        for film_id, role, person_id, full_name in self.manager.fetchall(
+            self.persons_sql, (ids,)
+        ):
+            persons[film_id, role][person_id] = full_name
+        return persons
+
+    def _genres(self, ids: tuple[str, ...]) -> dict[str, dict]:
+        """Names of genres of every film with the rank of the name among them"""
+
+        genres: dict[str, dict] = defaultdict(dict)
+        for film_id, genre_id, name, rank in self.manager.fetchall(
+            self.genres_sql, (ids,)
+        ):
+            genres[film_id][genre_id] = name, rank
+        return genres
+
+    def fetch(self, ids: tuple[str, ...]) -> list:
+        films = self.manager.fetchall(self.films_sql, (ids,))
+        if not films:
+            return []
+        persons, genres = self._persons(ids), self._genres(ids)
+
+        rows = []
+        for film_id, title, description, rating in films:
+            crew = (
+                [
+                    {"id": person_id, "full_name": full_name}
+                    for person_id, full_name in persons[film_id, role].items()
+                ]
+                for role in self.roles
+            )
+            film_genres = genres[film_id]
+            # equal names share their rank
+            names = {rank: name for name, rank in film_genres.values()}
+            rows.append(
+                (
+                    film_id,
+                    title,
+                    description,
+                    rating,
+                    [names[rank] for rank in sorted(names)],
+                    *crew,
+                    [
+                        {"id": genre_id, "name": name}
+                        for genre_id, (name, _) in film_genres.items()
+                    ],
+                )
+            )
+        return list(self.transform_to_entries(rows))
 
 
 class GenrePostgresMerger(PostgresMerger):
+    model = GenreDocument
     sql = (
         "SELECT g.id, g.name, g.description "
         "FROM content.genre g "
         "WHERE g.id IN %s ORDER BY g.modified ASC ;"
     )
 
-    def transform_to_entries(self, rows: Iterable[DictRow]) -> Iterable[GenreDocument]:
-        entries = (
-            GenreDocument.parse_obj(
-                {
-                    field.lower(): value
-                    for field, value in zip(
-                        GenreDocument.schema()["properties"].keys(), row  # type: ignore
-                    )
-                }
-            )
-            for row in rows
-        )
-        return entries
-
 
 class PersonPostgresMerger(PostgresMerger):
+    model = PersonDocument
     sql = (
         "SELECT p.id, p.full_name "
         "FROM content.person AS p "
         "WHERE p.id IN %s ORDER BY p.modified ASC;"
     )
-
-    def transform_to_entries(self, rows: Iterable[DictRow]) -> Iterable[PersonDocument]:
-        entries = (
-            PersonDocument.parse_obj(
-                {
-                    field.lower(): value
-                    for field, value in zip(
-                        PersonDocument.schema()["properties"].keys(), row  # type: ignore
-                    )
-                }
-            )
-            for row in rows
-        )
-        return entries
@@ -0,0 +1,135 @@
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from time import monotonic, time
+from typing import Iterable, Iterator, TypeVar
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from .config.settings import settings
+
+T = TypeVar("T")
+
+ROWS_PRODUCED = Counter(
+    "etl_rows_produced", "Changed rows read by table scans", ["table"]
+)
+SCAN_SECONDS = Histogram(
+    "etl_scan_seconds", "Time of reading one page of changed rows", ["table"]
+)
+IDS_ENRICHED = Counter(
+    "etl_ids_enriched", "Ids of documents affected by changes", ["index", "table"]
+)
+DOCUMENTS_MERGED = Counter("etl_documents_merged", "Documents read", ["index"])
+DOCUMENTS_TRANSFORMED = Counter(
+    "etl_documents_transformed", "Documents prepared for loading", ["index"]
+)
+DOCUMENTS_SKIPPED = Counter(
+    "etl_documents_skipped", "Documents not loaded as unchanged", ["index"]
+)
+DOCUMENTS_DELETED = Counter(
+    "etl_documents_deleted", "Documents deleted for deleted rows", ["index"]
+)
+BULK_ITEMS = Counter("etl_bulk_items", "Operations sent with bulk requests", ["index"])
+BULK_BYTES = Counter(
+    "etl_bulk_bytes", "Estimated size of operations sent with bulk requests", ["index"]
+)
+BULK_ERRORS = Counter("etl_bulk_errors", "Operations rejected by bulk", ["index"])
+DEAD_LETTERS = Counter(
+    "etl_dead_letters", "Documents put aside as rejected for good", ["index"]
+)
+PARTIAL_UPDATES = Counter(
+    "etl_partial_updates",
+    "Documents updated in place for changed rows",
+    ["index", "table"],
+)
+STAGE_SECONDS = Histogram(
+    "etl_stage_seconds", "Time of a stage for one batch", ["index", "stage"]
+)
+BATCH_FAILURES = Counter(
+    "etl_batch_failures", "Batches left for the next cycle", ["index", "table"]
+)
+REPLICATION_LAG = Gauge(
+    "etl_replication_lag_seconds",
+    "Time since modification of the last loaded row",
+    ["index", "table"],
+)
+POLL_INTERVAL = Gauge(
+    "etl_poll_interval_seconds", "Current polling interval of the index", ["index"]
+)
+LAST_CYCLE_SUCCESS = Gauge(
+    "etl_last_cycle_success", "1 if every batch of the last cycle was loaded"
+)
+LAST_CYCLE_SECONDS = Gauge("etl_last_cycle_seconds", "Duration of the last cycle")
+LAST_CYCLE_TIMESTAMP = Gauge(
+    "etl_last_cycle_timestamp_seconds", "End time of the last cycle"
+)
+
+_watermarks: dict[tuple[str, str], float] = {}
+
+
+def serve():
+    if not settings.metrics_port:
+        return
+    start_http_server(settings.metrics_port, settings.metrics_host)
+    logging.info(f"Serving metrics on port {settings.metrics_port}")
+
+
+def timed(items: Iterable[T], index: str, stage: str) -> Iterator[T]:
+    """Yields the items, observing time spent on producing every one"""
+
+    iterator = iter(items)
+    while True:
+        started = monotonic()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        STAGE_SECONDS.labels(index, stage).observe(monotonic() - started)
+        yield item
+
+
+@contextmanager
+def measure(index: str, stage: str):
+    started = monotonic()
+    yield
+    STAGE_SECONDS.labels(index, stage).observe(monotonic() - started)
+
+
+def watermark(index: str, table: str, modified: datetime):
+    """Lag is counted at scrape time, so it grows while nothing is loaded"""
+
+    if modified.year == datetime.min.year:
+        # nothing loaded yet
+        return
+
+    key = (index, table)
+    if key not in _watermarks:
+        REPLICATION_LAG.labels(index, table).set_function(
+            lambda: time() - _watermarks[key]
+        )
+    _watermarks[key] = modified.timestamp()
+
+
+class CycleOutcome:
+    def __init__(self):
+        self.failures = 0
+
+    def failed(self, index: str, table: str = ""):
+        BATCH_FAILURES.labels(index, table).inc()
+        self.failures += 1
+
+    @contextmanager
+    def track(self):
+        self.failures = 0
+        started = monotonic()
+        success = False
+        try:
+            yield
+            success = not self.failures
+        finally:
+            LAST_CYCLE_SUCCESS.set(int(success))
+            LAST_CYCLE_SECONDS.set(monotonic() - started)
+            LAST_CYCLE_TIMESTAMP.set_to_current_time()
+
+
+cycle = CycleOutcome()
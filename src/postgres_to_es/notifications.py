@@ -0,0 +1,110 @@
+import logging
+import select
+from time import monotonic
+from typing import cast
+
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extensions import connection as pg_connection
+
+from .config.settings import settings
+from .connections import PostgresConnector, backing_connect
+
+NOTIFY_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION content.etl_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify(TG_ARGV[0], TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+NOTIFY_TRIGGER_SQL = (
+    "DROP TRIGGER IF EXISTS etl_notify ON {table}; "
+    "CREATE TRIGGER etl_notify AFTER INSERT OR UPDATE OR DELETE ON {table} "
+    "FOR EACH STATEMENT EXECUTE FUNCTION content.etl_notify('{channel}');"
+)
+
+
+class PostgresListener:
+    """
+    Waits for notifications which triggers on content tables send on change.
+
+    Payload of a notification is the name of the changed table.
+    """
+
+    def __init__(self, connector: PostgresConnector, channel: str | None = None):
+        self.connector = connector
+        self.channel = channel or settings.notify_channel
+        self.connection: pg_connection | None = None
+
+    def install_triggers(self, tables: list[str]):
+        with self.get_connection().cursor() as cursor:
+            cursor.execute(NOTIFY_FUNCTION_SQL)
+            for table in tables:
+                cursor.execute(
+                    NOTIFY_TRIGGER_SQL.format(table=table, channel=self.channel)
+                )
+        logging.info(f"Installed notify triggers for {', '.join(tables)}")
+
+    def _listen(self) -> pg_connection:
+        self.connector.reconnect()
+        connection = cast(pg_connection, self.connector.connection)
+        connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel};")
+        logging.debug(f"Listening to channel {self.channel}")
+        return connection
+
+    def get_connection(self) -> pg_connection:
+        if not self.connection:
+            self.connection = backing_connect(self.connector)(self._listen)()
+        return self.connection
+
+    def _poll(self, timeout: float) -> set[str]:
+        connection = self.get_connection()
+        if select.select([connection], [], [], timeout) == ([], [], []):
+            return set()
+
+        connection.poll()
+        tables = {notify.payload for notify in connection.notifies}
+        connection.notifies.clear()
+        return tables
+
+    def poll(self, timeout: float) -> set[str]:
+        try:
+            return self._poll(timeout)
+        except Exception as e:
+            # next poll will listen on a fresh connection
+            logging.error(e)
+            self.close()
+            return set()
+
+    def wait(self, timeout: float) -> set[str]:
+        """
+        Tables changed since the last call.
+
+        Waits up to `timeout` seconds for the first notification, then keeps
+        collecting while notifications keep coming, but no longer than
+        `notify_debounce_max` seconds. Returns empty set if the channel stayed
+        quiet.
+        """
+
+        tables = self.poll(timeout)
+        if not tables:
+            return tables
+
+        deadline = monotonic() + settings.notify_debounce_max
+        while (left := deadline - monotonic()) > 0:
+            burst = self.poll(min(settings.notify_debounce, left))
+            if not burst:
+                break
+            tables |= burst
+
+        logging.debug(f"Notified about changes in {', '.join(tables)}")
+        return tables
+
+    def close(self):
+        if not self.connection:
+            return
+        self.connection.close()
+        self.connection = None
@@ -0,0 +1,122 @@
+import logging
+from dataclasses import dataclass
+from queue import Queue
+from threading import Thread
+from typing import Any, Callable, Iterable, Sequence
+
+from .exceptions import Error
+from .models import Entry
+
+
+@dataclass
+class Batch:
+    """Rows of a table produced at once and checkpointed together"""
+
+    table: str
+    index_name: str
+    entry: Entry
+    failed: bool = False
+
+
+Stage = Callable[[Batch, Any], Iterable[Any]]
+
+# follows the last item of a batch through every stage
+_END = object()
+# no more batches
+_STOP = object()
+
+
+class Pipeline:
+    """
+    Runs every stage in its own thread.
+
+    Stages are connected with bounded queues, so a slow stage holds back
+    the ones before it. The items of a batch are followed by a marker
+    which reaches the end of the pipeline only after all of them were
+    processed, then the batch is reported done or failed.
+    """
+
+    def __init__(self, stages: Sequence[Stage], queue_size: int):
+        self.stages = stages
+        self.queues: list[Queue] = [
+            Queue(maxsize=queue_size) for _ in range(len(stages) + 1)
+        ]
+        self.fatal: BaseException | None = None
+
+    def _produce(self, source: Iterable[tuple[Batch, Any]]):
+        queue = self.queues[0]
+        try:
+            for batch, payload in source:
+                if self.fatal:
+                    break
+                queue.put((batch, payload))
+                queue.put((batch, _END))
+        except BaseException as e:
+            self.fatal = e
+        finally:
+            queue.put(_STOP)
+
+    def _process(self, batch: Batch, payload: Any, stage: Stage, output: Queue):
+        if batch.failed or self.fatal:
+            return
+        try:
+            for item in stage(batch, payload):
+                output.put((batch, item))
+        except Error as e:
+            logging.error(e)
+            batch.failed = True
+        except BaseException as e:
+            batch.failed = True
+            self.fatal = e
+
+    def _work(self, stage: Stage, input: Queue, output: Queue):
+        while (item := input.get()) is not _STOP:
+            batch, payload = item
+            if payload is _END:
+                output.put(item)
+                continue
+            self._process(batch, payload, stage, output)
+        output.put(_STOP)
+
+    def _report(
+        self, on_done: Callable[[Batch], None], on_failed: Callable[[Batch], None]
+    ):
+        sink = self.queues[-1]
+        while (item := sink.get()) is not _STOP:
+            batch, payload = item
+            if payload is not _END:
+                continue
+            if batch.failed:
+                on_failed(batch)
+            else:
+                on_done(batch)
+
+    def run(
+        self,
+        source: Iterable[tuple[Batch, Any]],
+        on_done: Callable[[Batch], None],
+        on_failed: Callable[[Batch], None],
+    ):
+        threads = [Thread(target=self._produce, args=(source,), daemon=True)]
+        for stage, input, output in zip(self.stages, self.queues, self.queues[1:]):
+            threads.append(
+                Thread(target=self._work, args=(stage, input, output), daemon=True)
+            )
+        for thread in threads:
+            thread.start()
+
+        try:
+            self._report(on_done, on_failed)
+        except BaseException as e:
+            # a failed callback stops the stages, the queues are drained
+            # so that none of them is left blocked on a full one
+            self.fatal = e
+            while self.queues[-1].get() is not _STOP:
+                pass
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+
+        if self.fatal:
+            raise self.fatal
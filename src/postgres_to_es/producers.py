@@ -1,9 +1,15 @@
+import logging
 from abc import ABC, abstractmethod
+from time import monotonic
 from typing import Iterable
 
+from . import metrics
+from .config.settings import TOMBSTONE_TABLE, settings
 from .connections import ConnectionManager, PostgresConnectionManager
 from .models import Entry
+from .shards import Shard
 from .state import State
+from .tuning import get_tuner
 
 
 def scan(tables, scanning_method) -> Iterable[tuple[str, Iterable]]:
@@ -13,18 +19,110 @@ def scan(tables, scanning_method) -> Iterable[tuple[str, Iterable]]:
     return
 
 
+def date_field(table: str) -> str:
+    if table in ("content.genre_film_work", "content.person_film_work"):
+        return "created"
+    if table == TOMBSTONE_TABLE:
+        return "deleted"
+    return "modified"
+
+
+def scan_sql(
+    table: str, state: Entry, pack_size: int, shard: Shard | None = None
+) -> tuple[str, tuple]:
+    """A page of rows after the watermark in (date, id) keyset order"""
+
+    field = date_field(table)
+    sql_vars: tuple = (state.modified, str(state.id))
+
+    shard_condition = ""
+    if shard:
+        shard_condition = f"and {shard.condition()} "
+        sql_vars += shard.params()
+
+    sql = (
+        f"select {field}, id from {table} where ({field}, id) > (%s, %s) "
+        f"{shard_condition}order by {field} asc, id asc limit %s;"
+    )
+    return sql, sql_vars + (pack_size,)
+
+
+INDEX_COLUMNS_SQL = (
+    "SELECT array_agg(a.attname ORDER BY k.n) "
+    "FROM pg_index i "
+    "CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, n) "
+    "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum "
+    "WHERE i.indrelid = %s::regclass GROUP BY i.indexrelid;"
+)
+
+
+def check_scan_indexes(
+    manager: PostgresConnectionManager, tables: Iterable[tuple[str, int]]
+) -> list[str]:
+    """Tables without a (date, id) index the keyset scan relies on"""
+
+    missing = []
+    for table, _ in tables:
+        key = [date_field(table), "id"]
+        indexes = manager.fetchall(INDEX_COLUMNS_SQL, (table,))
+        if not any(list(columns[:2]) == key for columns, in indexes):
+            logging.warning(
+                f"No index on {table} ({', '.join(key)}), scans will be slow. "
+                f"CREATE INDEX ON {table} ({', '.join(key)});"
+            )
+            missing.append(table)
+    return missing
+
+
 class Producer(ABC):
-    def __init__(self, state: State, manager: ConnectionManager):
+    def __init__(
+        self, state: State, manager: ConnectionManager, shard: Shard | None = None
+    ):
         self.state: State = state
         self.not_processed_entities = {}
         self.manager: ConnectionManager = manager
+        self.shard = shard
 
-    def set_state(self, table: str, index_name: str):
-        entity = self.not_processed_entities[table]
-        self.state.set_state(f"{index_name}:{table}", entity)
+    def state_key(self, table: str, index_name: str) -> str:
+        return f"{index_name}:{table}"
+
+    def _get_state(self, table: str, index_name: str) -> Entry:
+        return watermark(self.state, self.state_key(table, index_name), self.shard)
+
+    def get_state(self, table: str, index_name: str) -> Entry:
+        entity = self._get_state(table, index_name)
+        metrics.watermark(index_name, table, entity.modified)
+        return entity
+
+    def _store_state(self, table: str, index_name: str, entity: Entry):
+        key = self.state_key(table, index_name)
+        self.state.set_state(self.shard.key(key) if self.shard else key, entity)
+        metrics.watermark(index_name, table, entity.modified)
+
+    def set_state(self, table: str, index_name: str, entity: Entry | None = None):
+        entity = entity or self.not_processed_entities[table]
+        self._store_state(table, index_name, entity)
         # this batch processed sucessfully
         self.not_processed_entities[table] = None
 
+    def checkpoint(self, table: str, index_name: str, entity: Entry):
+        """
+        Stores the watermark of a batch handed over with `release()`,
+        leaving the scan going on meanwhile, maybe in another thread, alone
+        """
+
+        self._store_state(table, index_name, entity)
+
+    def release(self, table: str) -> Entry:
+        """
+        Hands the current batch over to be checkpointed later,
+        so scanning goes on before the batch is processed
+        """
+
+        entity = self.not_processed_entities[table]
+        self.not_processed_entities[table] = None
+        return entity
+
     @abstractmethod
     def scan_table(self, table: str, items: int = 50) -> Iterable:
         ...
@@ -37,29 +135,46 @@ class Producer(ABC):
 
 class PostgresProducer(Producer):
     def __init__(
-        self, state: State, manager: PostgresConnectionManager, index_name: str
+        self,
+        state: State,
+        manager: PostgresConnectionManager,
+        index_name: str,
+        shard: Shard | None = None,
     ):
-        super().__init__(state, manager)
+        super().__init__(state, manager, shard)
         self.manager: PostgresConnectionManager = manager
         self.index_name = index_name
 
     def scan_table(self, table: str, pack_size: int) -> Iterable:
-        state = self.state.get_state(f"{self.index_name}:{table}")
-        date_field = "modified"
-        if table in ("content.genre_film_work", "content.person_film_work"):
-            date_field = "created"
+        state = self.get_state(table, self.index_name)
+        return self._scan_from(table, state, pack_size)
 
-        sql = (
-            f"select {date_field}, id from {table} where {date_field} >= '{state.modified}' "
-            f"and id >= '{state.id}' order by {date_field} asc, id asc;"
-        )
+    def _processing_failed(self, table: str) -> bool:
+        return bool(self.not_processed_entities.get(table))
+
+    def _scan_from(self, table: str, state: Entry, pack_size: int) -> Iterable:
+        tuner = get_tuner(f"scan:{table}", pack_size, settings.adaptive_scan_seconds)
+        while True:
+            if self.shard and not self.shard.leased():
+                # another worker may be scanning it already
+                logging.warning(f"Stopped scanning {table} of lost shard")
+                return
+            pack_size = tuner.size
+            sql, sql_vars = scan_sql(table, state, pack_size, self.shard)
+            started = monotonic()
+            rows = self.manager.fetchall(sql, sql_vars)
+            elapsed = monotonic() - started
+            tuner.observe(len(rows), elapsed)
+            metrics.SCAN_SECONDS.labels(table).observe(elapsed)
+            metrics.ROWS_PRODUCED.labels(table).inc(len(rows))
+            if not rows:
+                return
 
-        for rows in self.manager.fetchmany(sql, pack_size, itersize=5000):
             rows = [Entry(modified=row[0], id=row[1]) for row in rows]
 
             # Processing didn't go on happy path
 
-            if self.not_processed_entities.get(table):
+            if self._processing_failed(table):
                 return
 
             # Remembering current batch
@@ -67,3 +182,83 @@ class PostgresProducer(Producer):
             self.not_processed_entities[table] = rows[-1]
 
             yield rows
+
+            if len(rows) < pack_size:
+                return
+            state = rows[-1]
+
+
+def watermark(state: State, key: str, shard: Shard | None = None) -> Entry:
+    if not shard:
+        return state.get_state(key)
+
+    # a shard starts from the watermark of the unsharded run
+    shard_key = shard.key(key)
+    if shard_key not in state.cache:
+        return state.get_state(key)
+    return state.get_state(shard_key)
+
+
+def entry_key(entry: Entry) -> tuple:
+    return entry.modified, entry.id
+
+
+class SharedPostgresProducer(PostgresProducer):
+    """
+    Scans every table once for several indices.
+
+    The scan starts from the oldest watermark among the indices, each batch
+    is handed only to the indices that haven't seen it yet and the
+    watermarks are moved separately for every index.
+    """
+
+    def __init__(
+        self,
+        state: State,
+        manager: PostgresConnectionManager,
+        index_names: Iterable[str],
+        shard: Shard | None = None,
+    ):
+        # there's no single index, every one keeps its own watermarks
+        super().__init__(state, manager, "", shard)
+        self.index_names = tuple(index_names)
+        self.watermarks: dict[str, dict[str, Entry]] = {}
+        self.failed: dict[str, set[str]] = {}
+
+    def scan_table(self, table: str, pack_size: int) -> Iterable:
+        self.watermarks[table] = {
+            index_name: self.get_state(table, index_name)
+            for index_name in self.index_names
+        }
+        self.failed[table] = set()
+        oldest = min(self.watermarks[table].values(), key=entry_key)
+        return self._scan_from(table, oldest, pack_size)
+
+    def _processing_failed(self, table: str) -> bool:
+        return len(self.failed[table]) == len(self.index_names)
+
+    def consumers(
+        self, table: str, entries: Iterable[Entry]
+    ) -> Iterable[tuple[str, list[Entry]]]:
+        """Pairs of index and the part of the batch it has to process"""
+
+        for index_name, watermark in self.watermarks[table].items():
+            if index_name in self.failed[table]:
+                continue
+
+            since = entry_key(watermark)
+            # the watermark itself was processed already
+            pending = [entry for entry in entries if entry_key(entry) > since]
+            if pending:
+                yield index_name, pending
+
+    def set_state(self, table: str, index_name: str, entity: Entry | None = None):
+        self.checkpoint(table, index_name, entity or self.not_processed_entities[table])
+
+    def checkpoint(self, table: str, index_name: str, entity: Entry):
+        super().checkpoint(table, index_name, entity)
+        self.watermarks[table][index_name] = entity
+
+    def set_failed(self, table: str, index_name: str):
+        # the index will resume from its own watermark next cycle
+        self.failed[table].add(index_name)
@@ -0,0 +1,106 @@
+import cProfile
+import logging
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import ContextManager, Iterable, Iterator, TypeVar
+
+from .config.settings import settings
+
+T = TypeVar("T")
+
+# batches of these stages are measured with tracemalloc
+TRACED_STAGES = ("enrich", "merge")
+_DONE = object()
+
+
+def dump(profiler: cProfile.Profile, name: str):
+    directory = Path(settings.profile_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name}-{datetime.now():%Y%m%dT%H%M%S.%f}.prof"
+    profiler.dump_stats(path)
+    logging.info(f"Profile saved to {path}")
+
+
+@contextmanager
+def _profile_cycle(number: int):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        dump(profiler, f"cycle-{number}")
+
+
+def profile_cycle(number: int) -> ContextManager:
+    """Profiles the thread running the cycle if its number is chosen"""
+
+    if number not in settings.profile_cycles:
+        return nullcontext()
+    return _profile_cycle(number)
+
+
+class StageHooks:
+    """
+    CPU profiles of the stages named in `profile_stages`, collected over
+    a run and saved with `dump()`, and allocation peaks of every enricher
+    and merger batch with `trace_allocations`. Stages without hooks are
+    left as they are.
+    """
+
+    def __init__(self, index_name: str):
+        self.index_name = index_name
+        self.profiles = {stage: cProfile.Profile() for stage in settings.profile_stages}
+        if settings.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _traced(self, stage: str) -> bool:
+        return settings.trace_allocations and stage in TRACED_STAGES
+
+    @contextmanager
+    def _hooked(self, stage: str):
+        profiler = self.profiles.get(stage)
+        traced = self._traced(stage)
+        if traced:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            if traced:
+                peak = tracemalloc.get_traced_memory()[1] - before
+                logging.info(
+                    f"Allocation peak of {stage} batch "
+                    f"({self.index_name}): {peak / 2**20:.2f} MB"
+                )
+
+    def stage(self, stage: str) -> ContextManager:
+        if stage not in self.profiles and not self._traced(stage):
+            return nullcontext()
+        return self._hooked(stage)
+
+    def wrap(self, items: Iterable[T], stage: str) -> Iterable[T]:
+        """Hooks producing of every item"""
+
+        if stage not in self.profiles and not self._traced(stage):
+            return items
+        return self._wrap(iter(items), stage)
+
+    def _wrap(self, iterator: Iterator[T], stage: str) -> Iterator[T]:
+        while True:
+            with self.stage(stage):
+                item = next(iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item  # type: ignore
+
+    def dump(self):
+        for stage, profiler in self.profiles.items():
+            dump(profiler, f"{self.index_name}-{stage}")
+            self.profiles[stage] = cProfile.Profile()
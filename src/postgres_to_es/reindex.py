@@ -0,0 +1,110 @@
+import logging
+from datetime import datetime
+from typing import Any
+
+from .config.settings import settings
+from .connections import ElasticConnectionManager
+from .indices import ANALYSIS, definitions
+from .state import State
+
+
+class Reindexer:
+    """
+    Full rebuild of an index behind an alias.
+
+    Documents are loaded into a new versioned index created with the
+    current definition, without replicas and refresh.
+    After the load settings are restored, the index is force-merged and
+    the alias is moved to it in one request.
+    """
+
+    def __init__(self, elastic: ElasticConnectionManager, alias: str):
+        self.elastic = elastic
+        self.alias = alias
+        self.mappings = definitions()[alias]
+        self.live: dict[str, Any] = {}
+        # the alias points to the new index, it isn't unfinished anymore
+        self.swapped = False
+
+    def _live_index(self) -> dict[str, Any]:
+        """Definition of the index the alias (or index with its name) points to"""
+
+        found = self.elastic.call("indices.get", index=self.alias).body
+        if len(found) != 1:
+            raise ValueError(f"{self.alias} points to {len(found)} indices")
+        ((name, definition),) = found.items()
+        return {"name": name, **definition}
+
+    def create_versioned(self) -> str:
+        self.live = self._live_index()
+        live_settings = self.live["settings"]["index"]
+        name = f"{self.alias}_{datetime.utcnow():%Y%m%d%H%M%S}"
+
+        self.elastic.call(
+            "indices.create",
+            index=name,
+            settings={
+                "number_of_shards": live_settings["number_of_shards"],
+                "number_of_replicas": 0,
+                "refresh_interval": "-1",
+                "analysis": ANALYSIS,
+            },
+            mappings=self.mappings,
+        )
+        logging.info(f"Created index {name} for {self.alias}")
+        return name
+
+    def finish(self, name: str):
+        live_settings = self.live["settings"]["index"]
+
+        self.elastic.call(
+            "indices.put_settings",
+            index=name,
+            settings={
+                "number_of_replicas": live_settings.get("number_of_replicas", 1),
+                "refresh_interval": live_settings.get("refresh_interval", "1s"),
+            },
+        )
+        # merging takes longer than any request timeout, its task is polled
+        task = self.elastic.call(
+            "indices.forcemerge",
+            index=name,
+            max_num_segments=1,
+            wait_for_completion=False,
+        ).body
+        self.elastic.wait_for_task(task["task"])
+        self.elastic.call("indices.refresh", index=name)
+        self.swap(name)
+
+    def swap(self, name: str):
+        live = self.live["name"]
+        if live == self.alias:
+            # the live data is a plain index yet, it makes way for the alias
+            remove = {"remove_index": {"index": live}}
+        else:
+            remove = {"remove": {"index": live, "alias": self.alias}}
+
+        self.elastic.call(
+            "indices.update_aliases",
+            actions=[remove, {"add": {"index": name, "alias": self.alias}}],
+        )
+        self.swapped = True
+        logging.info(f"Alias {self.alias} moved from {live} to {name}")
+
+        if live != self.alias and not settings.reindex_keep_old:
+            self.elastic.call("indices.delete", index=live)
+            logging.info(f"Deleted index {live}")
+
+    def abort(self, name: str):
+        self.elastic.call("indices.delete", index=name)
+        logging.info(f"Deleted unfinished index {name}")
+
+
+def take_over_state(state: State, name: str, alias: str, tables: list[str]):
+    """Incremental loading of the alias goes on from where the rebuild stopped"""
+
+    for table in tables:
+        key = f"{name}:{table}"
+        if key in state.cache:
+            state.set_state(f"{alias}:{table}", state.get_state(key))
+    state.flush()
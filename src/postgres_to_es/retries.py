@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import random
+from contextlib import aclosing, contextmanager
+from dataclasses import dataclass
+from functools import cache
+from threading import Lock, get_ident
+from time import monotonic, sleep
+from typing import AsyncIterator, Callable, Iterable, Iterator, TypeVar
+
+from .config.settings import settings
+from .exceptions import CircuitOpenError, ConnectionFailedError
+
+T = TypeVar("T")
+
+
+def caller() -> object:
+    """The task of a running event loop or else the thread making a call"""
+
+    try:
+        return asyncio.current_task() or get_ident()
+    except RuntimeError:
+        return get_ident()
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Bounded attempts with full jitter waits, all of them within a deadline"""
+
+    attempts: int
+    base_delay: float
+    max_delay: float
+    deadline: float
+
+    def delay(self, attempt: int) -> float:
+        """Anywhere up to the exponential backoff, so retries don't flock"""
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def delays(self) -> Iterator[float]:
+        """Waits before every retry, stops when attempts or time run out"""
+
+        started = monotonic()
+        for attempt in range(self.attempts - 1):
+            delay = self.delay(attempt)
+            if monotonic() - started + delay > self.deadline:
+                return
+            yield delay
+
+
+@cache
+def connection_policy() -> RetryPolicy:
+    return RetryPolicy(
+        settings.retry_attempts,
+        settings.retry_base_delay,
+        settings.retry_max_delay,
+        settings.retry_deadline,
+    )
+
+
+@cache
+def bulk_item_policy() -> RetryPolicy:
+    return RetryPolicy(
+        settings.bulk_item_retries + 1,
+        settings.retry_base_delay,
+        settings.retry_max_delay,
+        settings.retry_deadline,
+    )
+
+
+class CircuitBreaker:
+    """
+    Fails calls to a backend at once after `breaker_threshold` calls in
+    a row gave up on it, for `breaker_cooldown` seconds. Then a single
+    call is let through to probe it, its success closes the circuit.
+    """
+
+    def __init__(self, name: str, threshold: int, cooldown: float):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+        # calls nested in the probe go through with it
+        self.prober: object = None
+        self.lock = Lock()
+
+    def check(self) -> bool:
+        """Whether the call let through is the probe one"""
+
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            if self.probing and self.prober == caller():
+                return False
+            if monotonic() - self.opened_at < self.cooldown or self.probing:
+                raise CircuitOpenError(f"Circuit of {self.name} is open")
+            self.probing = True
+            self.prober = caller()
+            return True
+
+    @contextmanager
+    def guard(self):
+        """
+        A call of the backend with all of its attempts. A probe ended by
+        an exception or abandoned is failed here, unless the given up call
+        has failed it already, so the circuit isn't left probing forever.
+        """
+
+        probe = self.check()
+        try:
+            yield
+        except BaseException:
+            if probe and self.probing:
+                self.failure()
+            raise
+
+    def success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logging.info(f"Circuit of {self.name} is closed")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logging.warning(f"Circuit of {self.name} is open")
+                self.opened_at = monotonic()
+
+
+@cache
+def get_breaker(name: str) -> CircuitBreaker:
+    """One for every backend in the process"""
+
+    return CircuitBreaker(name, settings.breaker_threshold, settings.breaker_cooldown)
+
+
+class Retrying:
+    """
+    Calls of one backend under a policy and its breaker.
+    `before_retry` runs before every next attempt, its failures count as
+    failures of the attempt. The breaker counts calls rather than attempts,
+    a call failing for good is one failure, so it runs out of its own
+    attempts or deadline before the circuit opens.
+    """
+
+    def __init__(
+        self,
+        policy: RetryPolicy,
+        breaker: CircuitBreaker,
+        errors: tuple[type[BaseException], ...],
+        before_retry: Callable[[], None] | None = None,
+    ):
+        self.policy = policy
+        self.breaker = breaker
+        self.errors = errors
+        self.before_retry = before_retry
+
+    def _failed(self, error: BaseException, delays: Iterator[float]) -> float:
+        logging.error(error)
+        delay = next(delays, None)
+        if delay is None:
+            self.breaker.failure()
+            raise ConnectionFailedError(
+                f"Gave up on {self.breaker.name}: {error}"
+            ) from error
+        logging.debug(f"Sleeping for {delay:.2f} seconds")
+        return delay
+
+    def _retry(self, retry: bool):
+        if retry and self.before_retry:
+            self.before_retry()
+
+    def call(self, func: Callable[..., T], *args, **kwargs) -> T:
+        delays = self.policy.delays()
+        retry = False
+        with self.breaker.guard():
+            while True:
+                try:
+                    self._retry(retry)
+                    result = func(*args, **kwargs)
+                    self.breaker.success()
+                    return result
+                except self.errors as e:
+                    sleep(self._failed(e, delays))
+                    retry = True
+
+    def iterate(self, func: Callable[..., Iterable[T]], *args, **kwargs) -> Iterator[T]:
+        """
+        Items of a generator, started over if it fails on the way.
+
+        Items produced before the failure are produced again, so consumers
+        must tolerate repeated items. The backend counts as reachable once
+        the first item is produced.
+        """
+
+        delays = self.policy.delays()
+        retry = False
+        with self.breaker.guard():
+            while True:
+                try:
+                    self._retry(retry)
+                    reached = False
+                    for item in func(*args, **kwargs):
+                        if not reached:
+                            self.breaker.success()
+                            reached = True
+                        yield item
+                    if not reached:
+                        self.breaker.success()
+                    return
+                except self.errors as e:
+                    sleep(self._failed(e, delays))
+                    retry = True
+
+    async def aiterate(self, func: Callable, *args, **kwargs) -> AsyncIterator:
+        """Async counterpart of `iterate`, items may be produced again"""
+
+        delays = self.policy.delays()
+        retry = False
+        with self.breaker.guard():
+            while True:
+                try:
+                    if retry and self.before_retry:
+                        await self.before_retry()  # type: ignore
+                    reached = False
+                    async with aclosing(func(*args, **kwargs)) as items:
+                        async for item in items:
+                            if not reached:
+                                self.breaker.success()
+                                reached = True
+                            yield item
+                    if not reached:
+                        self.breaker.success()
+                    return
+                except self.errors as e:
+                    await asyncio.sleep(self._failed(e, delays))
+                    retry = True
+
+    async def acall(self, func: Callable, *args, **kwargs):
+        delays = self.policy.delays()
+        retry = False
+        with self.breaker.guard():
+            while True:
+                try:
+                    if retry and self.before_retry:
+                        await self.before_retry()  # type: ignore
+                    result = await func(*args, **kwargs)
+                    self.breaker.success()
+                    return result
+                except self.errors as e:
+                    await asyncio.sleep(self._failed(e, delays))
+                    retry = True
@@ -0,0 +1,159 @@
+import logging
+from time import monotonic, sleep
+from typing import Iterable
+
+from . import metrics
+from .config.settings import settings
+from .connections import PostgresConnectionManager, get_pool
+from .models import Entry
+from .producers import date_field, entry_key, watermark
+from .shards import Shard
+from .state import RedisHashStorage, State
+
+Tables = list[tuple[str, int]]
+# a table, the number of a shard of it if sharded
+Part = tuple[str, int | None]
+
+# an interval shrinks by this much after changes and grows after a quiet poll
+SPEEDUP = 0.5
+SLOWDOWN = 2
+
+
+def latest_sql(
+    tables: Iterable[str], shards: Iterable[Shard | None]
+) -> tuple[str, tuple]:
+    """The last row of every shard of the tables in the keyset order of the scans"""
+
+    parts, sql_vars = [], ()
+    for table in tables:
+        for shard in shards:
+            condition = f"where {shard.condition()} " if shard else ""
+            sql_vars += shard.params() if shard else ()
+            parts.append(
+                f"(select '{table}', {shard.number if shard else 'null'}, "
+                f"{date_field(table)}, id from {table} {condition}"
+                f"order by {date_field(table)} desc, id desc limit 1)"
+            )
+    return " union all ".join(parts), sql_vars
+
+
+def scheduled_shards() -> list[Shard | None]:
+    """Every shard has a watermark of its own"""
+
+    if settings.shard_count < 2:
+        return [None]
+    return [
+        Shard(number, settings.shard_count) for number in range(settings.shard_count)
+    ]
+
+
+class ChangeProbe:
+    """Last rows of the tables, read from the ends of their scan indexes"""
+
+    def __init__(self, manager: PostgresConnectionManager):
+        self.manager = manager
+
+    def latest(
+        self, tables: Iterable[str], shards: Iterable[Shard | None]
+    ) -> dict[Part, Entry]:
+        rows = self.manager.fetchall(*latest_sql(tables, shards))
+        return {(row[0], row[1]): Entry(modified=row[2], id=row[3]) for row in rows}
+
+
+def is_behind(watermark: Entry, latest: Entry | None) -> bool:
+    if latest is None:
+        return False
+    if watermark.modified.year == 1:
+        # nothing was loaded yet
+        return True
+    return entry_key(latest) > entry_key(watermark)
+
+
+class Scheduler:
+    """
+    Polls every index at its own interval, between `schedule_min_interval`
+    and `schedule_max_interval` seconds. A poll compares the last rows of
+    the tables with the watermarks of the index: the interval shrinks when
+    some table is behind and grows when none is.
+
+    With `shard_count` above one, the last row of every shard is compared
+    with the watermark of the shard.
+    """
+
+    def __init__(self, index_names: Iterable[str], tables: Tables):
+        self.index_names = tuple(index_names)
+        self.tables = tables
+        self.intervals = {
+            index_name: settings.schedule_min_interval
+            for index_name in self.index_names
+        }
+        self.due_at = dict.fromkeys(self.index_names, 0.0)
+        self.shards = scheduled_shards()
+
+    def _adapt(self, index_name: str, changed: bool, now: float):
+        interval = self.intervals[index_name] * (SPEEDUP if changed else SLOWDOWN)
+        interval = min(
+            max(interval, settings.schedule_min_interval),
+            settings.schedule_max_interval,
+        )
+        self.intervals[index_name] = interval
+        self.due_at[index_name] = now + interval
+        metrics.POLL_INTERVAL.labels(index_name).set(interval)
+
+    def _changed(self, due: list[str]) -> dict[str, set[str]]:
+        """Tables behind the watermarks of every due index"""
+
+        _, postgres_manager, redis_manager = get_pool().managers()
+        with postgres_manager as postgres, redis_manager as redis:
+            latest = ChangeProbe(postgres).latest(
+                [table for table, _ in self.tables], self.shards
+            )
+            state = State(RedisHashStorage(redis))
+            return {
+                index_name: {
+                    table
+                    for table, _ in self.tables
+                    if self._behind(state, index_name, table, latest)
+                }
+                for index_name in due
+            }
+
+    def _behind(
+        self, state: State, index_name: str, table: str, latest: dict[Part, Entry]
+    ) -> bool:
+        return any(
+            is_behind(
+                # the key producers keep the watermark under
+                watermark(state, f"{index_name}:{table}", shard),
+                latest.get((table, shard.number if shard else None)),
+            )
+            for shard in self.shards
+        )
+
+    def poll(self) -> tuple[list[str], Tables]:
+        """Due indices with changes and the tables to scan for them"""
+
+        now = monotonic()
+        due = [name for name in self.index_names if self.due_at[name] <= now]
+        if not due:
+            return [], []
+
+        changed = self._changed(due)
+        for index_name in due:
+            self._adapt(index_name, bool(changed[index_name]), now)
+
+        behind = set().union(*changed.values())
+        logging.debug(f"Tables behind: {', '.join(behind) or 'none'}")
+        return (
+            [name for name in due if changed[name]],
+            [(table, size) for table, size in self.tables if table in behind],
+        )
+
+    def wait(self) -> tuple[list[str], Tables]:
+        """Sleeps until some due index has changes"""
+
+        while True:
+            sleep(max(0.0, min(self.due_at.values()) - monotonic()))
+            index_names, tables = self.poll()
+            if index_names:
+                return index_names, tables
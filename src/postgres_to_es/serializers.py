@@ -0,0 +1,118 @@
+import json
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from decimal import Decimal
+from functools import cache
+from typing import Any
+from uuid import UUID
+
+import orjson
+from elasticsearch.serializer import (
+    CompatibilityModeJsonSerializer,
+    CompatibilityModeNdjsonSerializer,
+    JsonSerializer,
+    NdjsonSerializer,
+)
+
+from .config.settings import settings
+from .exceptions import ConfigurationError
+
+
+def default(data: Any) -> Any:
+    if isinstance(data, UUID):
+        return str(data)
+    if isinstance(data, Decimal):
+        return float(data)
+    if isinstance(data, (date, datetime)):
+        return data.isoformat()
+    if isinstance(data, (tuple, set, frozenset)):
+        return list(data)
+    raise TypeError(f"Unable to serialize {data!r} (type: {type(data)})")
+
+
+class Serializer(ABC):
+    @abstractmethod
+    def dumps(self, data: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def loads(self, data: bytes | str) -> Any:
+        ...
+
+
+class StdlibSerializer(Serializer):
+    def dumps(self, data: Any) -> bytes:
+        return json.dumps(
+            data, default=default, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+    def loads(self, data: bytes | str) -> Any:
+        return json.loads(data)
+
+
+class OrjsonSerializer(Serializer):
+    """Handles UUID and datetime natively"""
+
+    def dumps(self, data: Any) -> bytes:
+        return orjson.dumps(data, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data: bytes | str) -> Any:
+        return orjson.loads(data)
+
+
+SERIALIZERS: dict[str, type[Serializer]] = {
+    "json": StdlibSerializer,
+    "orjson": OrjsonSerializer,
+}
+
+
+@cache
+def get_serializer() -> Serializer:
+    """The serializer chosen in settings, shared by the whole service"""
+
+    try:
+        return SERIALIZERS[settings.json_serializer]()
+    except KeyError:
+        raise ConfigurationError(f"Unknown serializer {settings.json_serializer}")
+
+
+class ElasticJsonMixin:
+    def json_dumps(self, data: Any) -> bytes:
+        return get_serializer().dumps(data)
+
+    def json_loads(self, data: bytes) -> Any:
+        return get_serializer().loads(data)
+
+
+class ElasticJsonSerializer(ElasticJsonMixin, JsonSerializer):
+    ...
+
+
+class ElasticNdjsonSerializer(ElasticJsonMixin, NdjsonSerializer):
+    ...
+
+
+class ElasticCompatibilityJsonSerializer(
+    ElasticJsonMixin, CompatibilityModeJsonSerializer
+):
+    ...
+
+
+class ElasticCompatibilityNdjsonSerializer(
+    ElasticJsonMixin, CompatibilityModeNdjsonSerializer
+):
+    ...
+
+
+def elastic_serializers() -> dict[str, JsonSerializer]:
+    """Serializers for the Elasticsearch client, bulk bodies go as ndjson"""
+
+    return {
+        serializer.mimetype: serializer()
+        for serializer in (
+            ElasticJsonSerializer,
+            ElasticNdjsonSerializer,
+            ElasticCompatibilityJsonSerializer,
+            ElasticCompatibilityNdjsonSerializer,
+        )
+    }
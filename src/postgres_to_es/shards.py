@@ -0,0 +1,217 @@
+import logging
+import os
+import socket
+from dataclasses import dataclass, field
+from functools import partial
+from math import ceil
+from threading import Event, Thread
+from time import monotonic, time
+from typing import Callable, cast
+from uuid import UUID
+
+from redis import Redis
+
+from .config.settings import settings
+from .connections import RedisConnectionManager
+from .exceptions import Error
+
+UUID_SPACE = 2**128
+
+# extend/delete a lease only while it's still ours
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Range of ids of every scanned table"""
+
+    number: int
+    count: int
+    # whether the lease of the shard is still held, if it's leased
+    held: Callable[[], bool] | None = field(default=None, compare=False, repr=False)
+
+    def leased(self) -> bool:
+        return self.held is None or self.held()
+
+    @property
+    def lower(self) -> UUID:
+        return UUID(int=self.number * UUID_SPACE // self.count)
+
+    @property
+    def upper(self) -> UUID | None:
+        if self.number == self.count - 1:
+            return None
+        return UUID(int=(self.number + 1) * UUID_SPACE // self.count)
+
+    def condition(self) -> str:
+        if self.upper:
+            return "id >= %s and id < %s"
+        return "id >= %s"
+
+    def params(self) -> tuple[str, ...]:
+        if self.upper:
+            return str(self.lower), str(self.upper)
+        return (str(self.lower),)
+
+    def key(self, key: str) -> str:
+        return f"{key}:{self.number}"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ShardLeases:
+    """
+    Shards claimed by this worker with expiring redis keys.
+
+    Workers announce themselves with a heartbeat, every worker claims its
+    fair share of shards and gives away the surplus when others join.
+    Leases of a dead worker expire and are claimed by the rest.
+    """
+
+    def __init__(
+        self,
+        conn_mann: RedisConnectionManager,
+        worker_id: str | None = None,
+        count: int | None = None,
+    ):
+        self.conn_mann = conn_mann
+        self.worker_id = worker_id or settings.worker_id or default_worker_id()
+        self.count = count or settings.shard_count
+        self.ttl = settings.shard_lease_ttl
+        self.held: set[int] = set()
+        # the leases expire `ttl` seconds after the last renewal
+        self.renewed_at = monotonic()
+        # scripts are run on the connection of the attempt
+        redis = conn_mann.get_connection()
+        self._renew = redis.register_script(RENEW_SCRIPT)
+        self._release = redis.register_script(RELEASE_SCRIPT)
+
+    @property
+    def redis(self) -> Redis:
+        """The current connection, a retry follows a reconnect"""
+
+        return cast(Redis, self.conn_mann.connector.connect())
+
+    def _lease_key(self, number: int) -> str:
+        return f"{settings.shard_lease_prefix}:{number}"
+
+    def _workers_key(self) -> str:
+        return f"{settings.shard_lease_prefix}:workers"
+
+    def _heartbeat(self) -> int:
+        now = time()
+        pipeline = self.redis.pipeline()
+        pipeline.zadd(self._workers_key(), {self.worker_id: now + self.ttl})
+        pipeline.zremrangebyscore(self._workers_key(), "-inf", now)
+        pipeline.zcard(self._workers_key())
+        return pipeline.execute()[-1]
+
+    def heartbeat(self) -> int:
+        """Announces the worker, returns number of live workers"""
+
+        return self.conn_mann.back_connection()(self._heartbeat)()
+
+    def _renew_all(self):
+        for number in tuple(self.held):
+            ttl_ms = int(self.ttl * 1000)
+            if not self._renew(
+                keys=[self._lease_key(number)],
+                args=[self.worker_id, ttl_ms],
+                client=self.redis,
+            ):
+                logging.warning(f"Lost lease of shard {number}")
+                self.held.discard(number)
+
+    def renew(self):
+        self.conn_mann.back_connection()(self._renew_all)()
+        self.renewed_at = monotonic()
+
+    def lapsed(self) -> bool:
+        """
+        Renewals failed for too long, the leases are about to expire and
+        other workers may claim the shards
+        """
+
+        return monotonic() - self.renewed_at > self.ttl * 2 / 3
+
+    def _give_away(self, share: int):
+        surplus = len(self.held) - share
+        if surplus <= 0:
+            return
+        for number in sorted(self.held, reverse=True)[:surplus]:
+            self._release(
+                keys=[self._lease_key(number)], args=[self.worker_id], client=self.redis
+            )
+            self.held.discard(number)
+            logging.info(f"Released shard {number}")
+
+    def _claim(self, share: int):
+        # workers start looking from different shards to avoid contention
+        start = hash(self.worker_id) % self.count
+        for offset in range(self.count):
+            if len(self.held) >= share:
+                return
+            number = (start + offset) % self.count
+            if number in self.held:
+                continue
+            if self.redis.set(
+                self._lease_key(number), self.worker_id, nx=True, ex=self.ttl
+            ):
+                logging.info(f"Claimed shard {number}")
+                self.held.add(number)
+
+    def claim(self) -> list[Shard]:
+        share = ceil(self.count / max(self.heartbeat(), 1))
+        self.renew()
+        self.conn_mann.back_connection()(self._give_away)(share)
+        self.conn_mann.back_connection()(self._claim)(share)
+        return [
+            Shard(number, self.count, partial(self.holds_number, number))
+            for number in sorted(self.held)
+        ]
+
+    def holds_number(self, number: int) -> bool:
+        if self.held and self.lapsed():
+            logging.warning(f"Leases of shards {sorted(self.held)} lapsed")
+            self.held.clear()
+        return number in self.held
+
+    def holds(self, shard: Shard) -> bool:
+        return self.holds_number(shard.number)
+
+    def release_all(self):
+        self._give_away(0)
+
+
+class LeaseKeeper(Thread):
+    """Keeps leases alive while shards are being processed"""
+
+    def __init__(self, leases: ShardLeases):
+        super().__init__(daemon=True)
+        self.leases = leases
+        self.stopped = Event()
+
+    def run(self):
+        while not self.stopped.wait(self.leases.ttl / 3):
+            try:
+                self.leases.heartbeat()
+                self.leases.renew()
+            except (Exception, Error) as e:
+                # shards stop being processed once their leases lapse
+                logging.error(e)
+
+    def stop(self):
+        self.stopped.set()
@@ -1,11 +1,22 @@
-import json
 from abc import ABC, abstractmethod
 from datetime import datetime
 from typing import Any
 from uuid import UUID
 
+from .config.settings import settings
 from .connections import ConnectionManager, RedisConnectionManager
 from .models import Entry
+from .serializers import get_serializer
+
+
+def parse_entry(value: str | None) -> Entry:
+    if not value:
+        return Entry(modified=datetime(1, 1, 1, 1, 1, 1, 1), id=UUID(int=0))
+    return Entry.parse_obj(get_serializer().loads(value))
+
+
+def serialize_entry(entry: Entry) -> str:
+    return get_serializer().dumps(entry.dict()).decode()
 
 
 class BaseStorage(ABC):
@@ -14,6 +25,7 @@ class BaseStorage(ABC):
 
     @abstractmethod
     def save_state(self, state: dict[str, Any]):
+        """Persist given keys, leaving the rest of the stored state untouched"""
         ...
 
     @abstractmethod
@@ -22,33 +34,94 @@ class BaseStorage(ABC):
 
 
 class RedisStorage(BaseStorage):
-    def __init__(self, conn_mann: RedisConnectionManager):
+    """Legacy storage: the whole state in one JSON string"""
+
+    def __init__(self, conn_mann: RedisConnectionManager, key: str | None = None):
         super().__init__(conn_mann)
-        self.redis = conn_mann.get_connection()
+        self.key = key or settings.state_legacy_key
 
     def save_state(self, state: dict[str, Any]):
-        serialized = json.dumps(state)
-        self.conn_mann.back_connection()(self.redis.set)("etl_state", serialized)
+        stored = self.retrieve_state()
+        stored.update(state)
+        serialized = get_serializer().dumps(stored)
+        self.conn_mann.call("set", self.key, serialized)
 
     def retrieve_state(self) -> dict[str, Any]:
-        serialized = self.conn_mann.back_connection()(self.redis.get)("etl_state")
+        serialized = self.conn_mann.call("get", self.key)
         if not serialized:
             return {}
-        return json.loads(serialized)
+        return get_serializer().loads(serialized)
+
+
+class RedisHashStorage(BaseStorage):
+    """
+    Every `index:table` watermark is a separate field of one redis hash,
+    so a checkpoint rewrites only its own fields.
+    """
+
+    def __init__(self, conn_mann: RedisConnectionManager, key: str | None = None):
+        super().__init__(conn_mann)
+        self.key = key or settings.state_key
+
+    def save_state(self, state: dict[str, Any]):
+        if not state:
+            return
+        self.conn_mann.call("hset", self.key, mapping=state)
+
+    def retrieve_state(self) -> dict[str, Any]:
+        state = self.conn_mann.call("hgetall", self.key)
+        if state:
+            return state
+
+        # first start after migration: take over the old single-blob state
+        legacy = RedisStorage(self.conn_mann).retrieve_state()  # type: ignore
+        if legacy:
+            self.save_state(legacy)
+        return legacy
 
 
 class State:
-    def __init__(self, storage: BaseStorage):
+    """
+    Write-back cache in front of a storage.
+
+    Reads are served from memory, the storage is read on the first access
+    and on `refresh()`. Checkpoints are buffered and written in one batch
+    on `flush()` or after `flush_size` of them since the last write, even
+    if they keep overwriting the same few keys.
+    """
+
+    def __init__(self, storage: BaseStorage, flush_size: int | None = None):
         self.storage = storage
+        self.flush_size = flush_size or settings.state_flush_size
+        self._cache: dict[str, Any] | None = None
+        self._pending: dict[str, Any] = {}
+        self._unflushed = 0
+
+    @property
+    def cache(self) -> dict[str, Any]:
+        if self._cache is None:
+            self.refresh()
+        return self._cache  # type: ignore
+
+    def refresh(self):
+        self._cache = self.storage.retrieve_state()
+        # not yet flushed checkpoints are newer than the stored ones
+        self._cache.update(self._pending)
+
+    def flush(self):
+        if not self._pending:
+            return
+        self.storage.save_state(self._pending)
+        self._pending = {}
+        self._unflushed = 0
 
     def set_state(self, key: str, value: Entry):
-        state = self.storage.retrieve_state()
-        state[key] = value.json()
-        self.storage.save_state(state)
+        serialized = serialize_entry(value)
+        self.cache[key] = serialized
+        self._pending[key] = serialized
+        self._unflushed += 1
+        if self._unflushed >= self.flush_size:
+            self.flush()
 
     def get_state(self, key: str) -> Entry:
-        state = self.storage.retrieve_state()
-        value = state.get(key)
-        if not value:
-            return Entry(modified=datetime(1, 1, 1, 1, 1, 1, 1), id=UUID(int=0))
-        return Entry.parse_raw(value)
+        return parse_entry(self.cache.get(key))
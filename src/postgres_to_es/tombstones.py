@@ -0,0 +1,150 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from time import monotonic
+from typing import Iterable
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from .config.settings import TOMBSTONE_TABLE, settings
+from .connections import PostgresConnectionManager, get_pool
+from .models import Entry
+
+TOMBSTONE_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {TOMBSTONE_TABLE} (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    table_name text NOT NULL,
+    row_id uuid NOT NULL,
+    film_work_id uuid,
+    deleted timestamp with time zone NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS etl_tombstone_deleted_id
+    ON {TOMBSTONE_TABLE} (deleted, id);
+"""
+
+# the argument names the column with the film of the deleted row, if any
+TOMBSTONE_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION content.etl_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO {TOMBSTONE_TABLE} (table_name, row_id, film_work_id)
+    VALUES (
+        TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME,
+        OLD.id,
+        (to_jsonb(OLD) ->> TG_ARGV[0])::uuid
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+TOMBSTONE_TRIGGER_SQL = (
+    "DROP TRIGGER IF EXISTS etl_tombstone ON {table}; "
+    "CREATE TRIGGER etl_tombstone AFTER DELETE ON {table} "
+    "FOR EACH ROW EXECUTE FUNCTION content.etl_tombstone({film_column});"
+)
+
+# deleted tables and columns of their rows pointing to a film
+TOMBSTONE_TRIGGERS = {
+    "content.film_work": "id",
+    "content.person": "",
+    "content.genre": "",
+    "content.person_film_work": "film_work_id",
+    "content.genre_film_work": "film_work_id",
+}
+
+TOMBSTONES_SQL = (
+    f"select id, table_name, row_id, film_work_id, deleted from {TOMBSTONE_TABLE} "
+    "where id in %s;"
+)
+PURGE_SQL = f"delete from {TOMBSTONE_TABLE} where deleted < now() - %s::interval;"
+PURGE_INTERVAL = 60 * 60 * 24
+
+
+class Tombstone(BaseModel):
+    id: UUID
+    table_name: str
+    row_id: UUID
+    film_work_id: UUID | None
+    deleted: datetime
+
+
+@dataclass(frozen=True)
+class Deletion:
+    """Documents to delete, passed down the stages in the order of batches"""
+
+    ids: tuple[str, ...]
+
+
+def install_tombstones(manager: PostgresConnectionManager):
+    with manager.cursor(0) as cursor:
+        cursor.execute(TOMBSTONE_TABLE_SQL)
+        cursor.execute(TOMBSTONE_FUNCTION_SQL)
+        for table, film_column in TOMBSTONE_TRIGGERS.items():
+            cursor.execute(
+                TOMBSTONE_TRIGGER_SQL.format(
+                    table=table, film_column=f"'{film_column}'" if film_column else ""
+                )
+            )
+    manager.connection.commit()
+    logging.info(f"Installed tombstone triggers for {', '.join(TOMBSTONE_TRIGGERS)}")
+
+
+def purge_tombstones(manager: PostgresConnectionManager):
+    """Tombstones older than every watermark is expected to be"""
+
+    with manager.cursor(0) as cursor:
+        cursor.execute(PURGE_SQL, (f"{settings.tombstone_retention_days} days",))
+        purged = cursor.rowcount
+    manager.connection.commit()
+    logging.debug(f"Purged {purged} tombstones")
+
+
+class TombstonePurger:
+    """Purges old tombstones on the first call and once a day after it"""
+
+    def __init__(self):
+        self.purged_at: float | None = None
+
+    def __call__(self):
+        if self.purged_at and monotonic() - self.purged_at < PURGE_INTERVAL:
+            return
+        _, postgres_manager, _ = get_pool().managers()
+        with postgres_manager as postgres:
+            purge_tombstones(postgres)
+        self.purged_at = monotonic()
+
+
+class TombstoneReader:
+    def __init__(self, manager: PostgresConnectionManager):
+        self.manager = manager
+
+    def resolve(self, entries: Iterable[Entry]) -> list[Tombstone]:
+        """Tombstones behind the entries produced by the scan of their table"""
+
+        ids = tuple(str(entry.id) for entry in entries)
+        if not ids:
+            return []
+        rows = self.manager.fetchall(TOMBSTONES_SQL, (ids,))
+        return [
+            Tombstone(
+                id=row[0],
+                table_name=row[1],
+                row_id=row[2],
+                film_work_id=row[3],
+                deleted=row[4],
+            )
+            for row in rows
+        ]
+
+    def linked(self, sql: str, tombstones: list[Tombstone]) -> list[Entry]:
+        """Documents the links left behind by the deleted rows lead to"""
+
+        if not tombstones:
+            return []
+        ids = tuple(str(tombstone.row_id) for tombstone in tombstones)
+        deleted = max(tombstone.deleted for tombstone in tombstones)
+        return [
+            Entry(id=row[0], modified=deleted)
+            for row in self.manager.fetchall(sql, (ids,))
+        ]
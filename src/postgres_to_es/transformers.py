@@ -7,6 +7,12 @@ from .exceptions import DataInconsistentError
 from .models import FilmWorkDocument, GenreDocument, PersonDocument
 
 
+def as_dict(entry: BaseModel | dict[str, Any]) -> dict[str, Any]:
+    if isinstance(entry, BaseModel):
+        return entry.dict()
+    return entry
+
+
 class Transformer(ABC):
     @abstractmethod
     def transform(self, entries: Iterable) -> Iterable:
@@ -15,11 +21,11 @@ class Transformer(ABC):
 
 class SingleTransformer(Transformer, ABC):
     @abstractmethod
-    def transform_single(self, entry: BaseModel) -> dict[str, Any]:
+    def transform_single(self, entry: BaseModel | dict[str, Any]) -> dict[str, Any]:
         ...
 
     def transform(
-        self, entries: Iterable[FilmWorkDocument]
+        self, entries: Iterable[BaseModel | dict[str, Any]]
     ) -> Iterable[Mapping[str, Any]]:
         return [self.transform_single(entry) for entry in entries]
 
@@ -28,16 +34,17 @@ class FilmWork2MoviesTransformer(SingleTransformer):
     def person_names(self, persons: Iterable[Mapping[str, str]]):
         return tuple(person["full_name"] for person in persons)
 
-    def transform_single(self, entry: FilmWorkDocument) -> dict[str, Any]:
-        state = entry.dict()
+    def transform_single(
+        self, entry: FilmWorkDocument | dict[str, Any]
+    ) -> dict[str, Any]:
+        state = as_dict(entry)
         try:
-            state["imdb_rating"] = state.get("rating")
-            del state["rating"]
+            state["imdb_rating"] = state.pop("rating")
 
             state["director"] = self.person_names(state["directors"])
             state["actors_names"] = self.person_names(state["actors"])
             state["writers_names"] = self.person_names(state["writers"])
-        except KeyError or TypeError as e:
+        except (KeyError, TypeError) as e:
             raise DataInconsistentError(
                 f"Failed to transform entry {state}." f" Error msg: {e}"
             )
@@ -45,10 +52,12 @@ class FilmWork2MoviesTransformer(SingleTransformer):
 
 
 class GenreTransformer(SingleTransformer):
-    def transform_single(self, entry: GenreDocument) -> dict[str, Any]:
-        return entry.dict()
+    def transform_single(self, entry: GenreDocument | dict[str, Any]) -> dict[str, Any]:
+        return as_dict(entry)
 
 
 class PersonTransformer(SingleTransformer):
-    def transform_single(self, entry: PersonDocument) -> dict[str, Any]:
-        return entry.dict()
+    def transform_single(
+        self, entry: PersonDocument | dict[str, Any]
+    ) -> dict[str, Any]:
+        return as_dict(entry)
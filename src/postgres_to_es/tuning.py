@@ -0,0 +1,70 @@
+import logging
+from itertools import islice
+from typing import Any, Sequence
+
+from .config.settings import settings
+from .serializers import get_serializer
+
+
+def estimate_bytes(items: Sequence[Any], sample: int = 16) -> int:
+    """Serialized size of the items judging by the first few of them"""
+
+    if not items:
+        return 0
+    sampled = [len(get_serializer().dumps(item)) for item in islice(items, sample)]
+    return sum(sampled) * len(items) // len(sampled)
+
+
+class BatchTuner:
+    """
+    Size of the next batch picked from the latency and bytes of the last one.
+
+    The size moves halfway to the one the last batch would have taken
+    `target_seconds` (and `target_bytes`, if given) with, growing no more
+    than twice per batch and staying within `adaptive_min_size` and
+    `adaptive_max_size`. Without `adaptive_batching` the size stays initial.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        target_seconds: float,
+        target_bytes: int | None = None,
+    ):
+        self.name = name
+        self.size = initial
+        self.target_seconds = target_seconds
+        self.target_bytes = target_bytes
+
+    def _clamp(self, size: float) -> int:
+        return int(
+            min(max(size, settings.adaptive_min_size), settings.adaptive_max_size)
+        )
+
+    def observe(self, items: int, seconds: float, nbytes: int = 0):
+        if not settings.adaptive_batching or items <= 0:
+            return
+
+        desired = self.target_seconds * items / max(seconds, 1e-6)
+        if self.target_bytes and nbytes:
+            desired = min(desired, self.target_bytes * items / nbytes)
+        desired = min(desired, self.size * 2)
+
+        size = self._clamp((self.size + desired) / 2)
+        if size != self.size:
+            logging.debug(f"Batch size of {self.name}: {self.size} -> {size}")
+            self.size = size
+
+
+_tuners: dict[str, BatchTuner] = {}
+
+
+def get_tuner(
+    name: str, initial: int, target_seconds: float, target_bytes: int | None = None
+) -> BatchTuner:
+    """Tuners outlive cycles, so every cycle starts with the learned sizes"""
+
+    if name not in _tuners:
+        _tuners[name] = BatchTuner(name, initial, target_seconds, target_bytes)
+    return _tuners[name]
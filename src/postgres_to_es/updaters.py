@@ -0,0 +1,189 @@
+import logging
+from abc import ABC
+from typing import Any, Iterable
+
+from elasticsearch.helpers import scan
+
+from . import metrics
+from .connections import ElasticConnectionManager, PostgresConnectionManager
+from .exceptions import DataInconsistentError
+from .models import Entry
+
+# nested field of persons and the flat field with their names
+PERSON_FIELDS = {
+    "actors": "actors_names",
+    "directors": "director",
+    "writers": "writers_names",
+}
+
+PERSON_NAMES_SCRIPT = """
+for (entry in params.fields.entrySet()) {
+    if (ctx._source[entry.getKey()] == null) {
+        continue;
+    }
+    def names = [];
+    for (person in ctx._source[entry.getKey()]) {
+        if (params.names.containsKey(person.id)) {
+            person.full_name = params.names[person.id];
+        }
+        names.add(person.full_name);
+    }
+    ctx._source[entry.getValue()] = names;
+}
+"""
+
+GENRE_NAMES_SCRIPT = """
+if (ctx._source.genres == null) {
+    return;
+}
+def names = new TreeSet();
+for (genre in ctx._source.genres) {
+    if (params.names.containsKey(genre.id)) {
+        genre.name = params.names[genre.id];
+    }
+    names.add(genre.name);
+}
+ctx._source.genre = new ArrayList(names);
+"""
+
+
+class PartialUpdater(ABC):
+    """
+    Writes changed names straight into the documents embedding them
+    with an update by query, instead of rebuilding those documents
+    """
+
+    table_name = ""
+    sql = ""
+    script = ""
+    nested_fields: tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        postgres: PostgresConnectionManager,
+        elastic: ElasticConnectionManager,
+        index_name: str,
+    ):
+        self.postgres = postgres
+        self.elastic = elastic
+        self.index_name = index_name
+
+    def params(self, names: dict[str, str]) -> dict[str, Any]:
+        return {"names": names}
+
+    def query(self, ids: list[str]) -> dict[str, Any]:
+        return {
+            "bool": {
+                "should": [
+                    {"nested": {"path": path, "query": {"terms": {f"{path}.id": ids}}}}
+                    for path in self.nested_fields
+                ],
+                "minimum_should_match": 1,
+            }
+        }
+
+    def _matching(self, ids: list[str]) -> list[str]:
+        hits = scan(
+            self.elastic.connector.connect(),
+            index=self.index_name,
+            query={"query": self.query(ids)},
+            _source=False,
+        )
+        return [hit["_id"] for hit in hits]
+
+    def matching(self, entries: Iterable[Entry]) -> list[str]:
+        """Ids of the documents embedding the rows"""
+
+        ids = [str(entry.id) for entry in entries]
+        if not ids:
+            return []
+        return self.elastic.back_connection()(self._matching)(ids)
+
+    def _update_by_query(self, names: dict[str, str]) -> str:
+        """Starts the update as a task, polled for its response"""
+
+        return self.elastic.call(
+            "update_by_query",
+            index=self.index_name,
+            query=self.query(list(names)),
+            script={
+                "source": self.script,
+                "lang": "painless",
+                "params": self.params(names),
+            },
+            # a conflicting document was just indexed from fresh rows
+            conflicts="proceed",
+            slices="auto",
+            wait_for_completion=False,
+        ).body["task"]
+
+    def update(self, entries: Iterable[Entry]):
+        ids = tuple(str(entry.id) for entry in entries)
+        if not ids:
+            return
+
+        rows = self.postgres.fetchall(self.sql, (ids,))
+        names = {str(row[0]): row[1] for row in rows}
+        if not names:
+            return
+
+        task_id = self._update_by_query(names)
+        response = self.elastic.wait_for_task(task_id)
+        if response.get("failures"):
+            logging.error(response["failures"])
+            raise DataInconsistentError(
+                f"Failed to update {len(response['failures'])} documents "
+                f"of {self.index_name}"
+            )
+        metrics.PARTIAL_UPDATES.labels(self.index_name, self.table_name).inc(
+            response.get("updated", 0)
+        )
+        logging.debug(
+            f"Updated {response.get('updated')} documents of {self.index_name} "
+            f"for {len(names)} rows of {self.table_name}"
+        )
+
+
+class PersonNamesUpdater(PartialUpdater):
+    table_name = "content.person"
+    sql = "select id, full_name from content.person where id in %s;"
+    script = PERSON_NAMES_SCRIPT
+    nested_fields = tuple(PERSON_FIELDS)
+
+    def params(self, names: dict[str, str]) -> dict[str, Any]:
+        return {"names": names, "fields": PERSON_FIELDS}
+
+
+class GenreNamesUpdater(PartialUpdater):
+    table_name = "content.genre"
+    sql = "select id, name from content.genre where id in %s;"
+    script = GENRE_NAMES_SCRIPT
+    nested_fields = ("genres",)
+
+
+class UpdaterManager:
+    updaters: tuple[type[PartialUpdater], ...]
+
+    def __init__(
+        self,
+        postgres: PostgresConnectionManager,
+        elastic: ElasticConnectionManager,
+        index_name: str,
+    ):
+        self._updaters = {
+            updater.table_name: updater(postgres, elastic, index_name)
+            for updater in self.updaters
+        }
+
+    def handles(self, table_name: str) -> bool:
+        return table_name in self._updaters
+
+    def update(self, table_name: str, entries: Iterable[Entry]):
+        self._updaters[table_name].update(entries)
+
+    def matching(self, table_name: str, entries: Iterable[Entry]) -> list[str]:
+        return self._updaters[table_name].matching(entries)
+
+
+class FilmsUpdaterManager(UpdaterManager):
+    updaters = (PersonNamesUpdater, GenreNamesUpdater)
@@ -0,0 +1,77 @@
+"""Rebuilding ElasticSearch indices from scratch without downtime"""
+import argparse
+import logging
+
+from load_data import INDEX_MANAGERS, connection_managers
+from postgres_to_es.config.settings import settings
+from postgres_to_es.exceptions import DataInconsistentError
+from postgres_to_es.hashes import create_hash_store
+from postgres_to_es.indices import flagged_indices, unflag
+from postgres_to_es.reindex import Reindexer, take_over_state
+
+
+def reindex(alias: str):
+    elastic_manager, postgres_manager, redis_manager = connection_managers()
+    with (
+        elastic_manager as elastic,
+        postgres_manager as postgres,
+        redis_manager as redis,
+    ):
+        reindexer = Reindexer(elastic, alias)
+        name = reindexer.create_versioned()
+        hashes = create_hash_store(redis)
+        if hashes:
+            # every document of the new index is loaded
+            hashes.clear(name)
+        try:
+            # a new index name means new watermarks, every row is scanned
+            manager = INDEX_MANAGERS[alias](postgres, redis, elastic, name)
+            manager.execute_etl()
+            if manager.failed:
+                raise DataInconsistentError(f"Not every document got into {name}")
+            reindexer.finish(name)
+        except BaseException:
+            if not reindexer.swapped:
+                reindexer.abort(name)
+                if hashes:
+                    hashes.clear(name)
+            raise
+
+        tables = [table for table, _ in settings.tables_for_scan]
+        take_over_state(manager.state, name, alias, tables)
+        if hashes:
+            # documents of the alias are the rebuilt ones now
+            hashes.move(name, alias)
+        unflag(redis, alias)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    names = ", ".join(INDEX_MANAGERS)
+    parser.add_argument(
+        "indices",
+        nargs="*",
+        help=f"indices to rebuild ({names}), all of them if omitted",
+    )
+    parser.add_argument(
+        "--flagged",
+        action="store_true",
+        help="rebuild indices with mappings out of date",
+    )
+    args = parser.parse_args()
+    if args.flagged:
+        _, _, redis_manager = connection_managers()
+        with redis_manager as redis:
+            indices = sorted(flagged_indices(redis))
+    else:
+        indices = args.indices or list(INDEX_MANAGERS)
+    if unknown := set(indices) - set(INDEX_MANAGERS):
+        parser.error(f"unknown indices: {', '.join(unknown)}")
+
+    for alias in indices:
+        logging.info(f"Rebuilding {alias}...")
+        reindex(alias)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Loading documents put aside as dead letters once again"""
+import argparse
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from load_data import INDEX_MANAGERS, connection_managers
+from postgres_to_es.deadletters import DeadLetter, create_dead_letter_store
+from postgres_to_es.exceptions import ConfigurationError, Error
+from postgres_to_es.models import Entry
+
+
+def alias_of(index_name: str) -> str | None:
+    """Letters of a rebuilt index go to the alias pointing to it now"""
+
+    for alias in INDEX_MANAGERS:
+        if index_name == alias or index_name.startswith(f"{alias}_"):
+            return alias
+    return None
+
+
+def replay(count: int | None = None) -> int:
+    elastic_manager, postgres_manager, redis_manager = connection_managers()
+    with (
+        elastic_manager as elastic,
+        postgres_manager as postgres,
+        redis_manager as redis,
+    ):
+        store = create_dead_letter_store(redis)
+        if not store:
+            raise ConfigurationError("DEAD_LETTERS isn't set")
+
+        letters: dict[str, list[tuple[str, DeadLetter]]] = defaultdict(list)
+        for key, letter in store.read(count):
+            letters[alias_of(letter.index) or letter.index].append((key, letter))
+
+        replayed = 0
+        for alias, keyed in letters.items():
+            if alias not in INDEX_MANAGERS:
+                logging.error(f"No index {alias} for {len(keyed)} dead letters")
+                continue
+            manager = INDEX_MANAGERS[alias](postgres, redis, elastic, alias)
+            # documents are built from the current rows, rejected ones
+            # become new letters
+            ids = {letter.id for _, letter in keyed}
+            entries = [Entry(id=id_, modified=datetime.utcnow()) for id_ in ids]
+            try:
+                for documents in manager.merge(entries):
+                    documents = manager.transform(documents)
+                    manager.load(documents)
+                    ids -= {str(document["id"]) for document in documents}
+                # rows of the rest are gone
+                manager.loader.delete(ids)
+            except Error as e:
+                logging.error(e)
+                continue
+            store.remove(key for key, _ in keyed)
+            replayed += len(keyed)
+            logging.info(f"Replayed {len(keyed)} dead letters of {alias}")
+        return replayed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--count", type=int, help="the oldest letters to replay, all of them if omitted"
+    )
+    args = parser.parse_args()
+    logging.info(f"Replayed {replay(args.count)} dead letters")
+
+
+if __name__ == "__main__":
+    main()
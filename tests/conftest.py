@@ -0,0 +1,18 @@
+import os
+import sys
+from pathlib import Path
+
+# settings are read on import, the tests never reach the backends
+for name, value in {
+    "ELASTIC_ENDPOINT": "http://localhost:9200",
+    "POSTGRES_DB": "movies",
+    "POSTGRES_USER": "etl",
+    "POSTGRES_PASSWORD": "etl",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": "6379",
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
@@ -0,0 +1,33 @@
+from datetime import datetime
+from threading import Thread
+
+from postgres_to_es.deadletters import DeadLetter, FileDeadLetterStore
+
+
+def letter(id_: str) -> DeadLetter:
+    return DeadLetter(
+        index="movies", id=id_, status=400, error="mapper", failed_at=datetime.utcnow()
+    )
+
+
+def test_letters_added_during_removal_are_kept(tmp_path):
+    path = str(tmp_path / "letters.jsonl")
+    replay, etl = FileDeadLetterStore(path), FileDeadLetterStore(path)
+    etl.add([letter("1")])
+    ((key, _),) = replay.read()
+
+    # the etl appends while replay holds the file between reading and rewriting
+    adding = Thread(target=etl.add, args=([letter("2")],))
+    read_lines = replay._lines
+
+    def lines():
+        adding.start()
+        adding.join(timeout=0.2)
+        assert adding.is_alive()
+        return read_lines()
+
+    replay._lines = lines  # type: ignore
+    replay.remove([key])
+    adding.join()
+
+    assert [left.id for _, left in etl.read()] == ["2"]
@@ -0,0 +1,17 @@
+from unittest.mock import Mock
+
+from postgres_to_es.config.settings import settings
+from postgres_to_es.hashes import local_hash_store
+from postgres_to_es.indices import IndexBootstrap
+
+
+def test_created_index_drops_stored_hashes(monkeypatch):
+    monkeypatch.setattr(settings, "skip_unchanged", "local")
+    hashes = local_hash_store()
+    hashes.set_many("movies", {"1": "00000000000000ff"})
+    hashes.set_many("genres", {"2": "00000000000000ff"})
+
+    IndexBootstrap(Mock(), Mock()).create("movies", {})
+
+    assert hashes.get_many("movies", ["1"]) == [None]
+    assert hashes.get_many("genres", ["2"]) == ["00000000000000ff"]
@@ -0,0 +1,39 @@
+from datetime import datetime
+from uuid import UUID
+
+from postgres_to_es.mergers import FlatFilmWorkPostgresMerger
+from postgres_to_es.models import Entry
+
+FILM = str(UUID(int=1))
+
+
+class Database:
+    """Rows in the order a database with a linguistic collation sorts them"""
+
+    def fetchall(self, sql: str, sql_vars: tuple) -> list[tuple]:
+        if sql == FlatFilmWorkPostgresMerger.films_sql:
+            return [(FILM, "Amélie", None, 8.3)]
+        if sql == FlatFilmWorkPostgresMerger.persons_sql:
+            return [
+                (FILM, "actor", "b-person", "Émile"),
+                (FILM, "actor", "a-person", "Zoé"),
+            ]
+        # "Étrange" goes before "Fantasy" there, unlike in python
+        return [
+            (FILM, "a-genre", "Fantasy", 2),
+            (FILM, "b-genre", "Étrange", 1),
+            (FILM, "c-genre", "Fantasy", 2),
+        ]
+
+
+def test_lists_keep_database_order():
+    merger = FlatFilmWorkPostgresMerger(Database())  # type: ignore
+    ((document,),) = merger.merge([Entry(id=FILM, modified=datetime.utcnow())])
+
+    assert document["genre"] == ["Étrange", "Fantasy"]
+    assert [genre["id"] for genre in document["genres"]] == [
+        "a-genre",
+        "b-genre",
+        "c-genre",
+    ]
+    assert [actor["id"] for actor in document["actors"]] == ["b-person", "a-person"]
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+from typing import Any
+from uuid import UUID
+
+from postgres_to_es.models import Entry
+from postgres_to_es.producers import PostgresProducer
+from postgres_to_es.state import State
+
+TABLE = "content.film_work"
+STARTED = datetime(2023, 5, 1)
+
+
+class Storage:
+    def save_state(self, state: dict[str, Any]):
+        ...
+
+    def retrieve_state(self) -> dict[str, Any]:
+        return {}
+
+
+class Rows:
+    """A table read with the keyset scan query"""
+
+    def __init__(self, count: int):
+        self.rows = [
+            (STARTED + timedelta(seconds=number), UUID(int=number))
+            for number in range(1, count + 1)
+        ]
+
+    def fetchall(self, sql: str, sql_vars: tuple) -> list[tuple]:
+        modified, id_, size = sql_vars[0], UUID(sql_vars[1]), sql_vars[-1]
+        return [row for row in self.rows if row > (modified, id_)][:size]
+
+
+def test_late_success_keeps_scan_stopped_after_failure():
+    state = State(Storage())  # type: ignore
+    producer = PostgresProducer(state, Rows(10), "movies")  # type: ignore
+    batches = producer.scan([(TABLE, 2)])
+
+    _, first = next(batches)
+    done = producer.release(TABLE)
+    # the second batch fails, it's never released
+    _, second = next(batches)
+    # the first one is reported done only now
+    producer.checkpoint(TABLE, "movies", done)
+
+    assert next(batches, None) is None
+    assert producer.not_processed_entities[TABLE] == second[-1]
+    assert (
+        state.get_state(f"movies:{TABLE}")
+        == first[-1]
+        == Entry(modified=STARTED + timedelta(seconds=2), id=UUID(int=2))
+    )
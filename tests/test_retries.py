@@ -0,0 +1,80 @@
+import pytest
+
+from postgres_to_es import retries
+from postgres_to_es.config.settings import settings
+from postgres_to_es.exceptions import CircuitOpenError, ConnectionFailedError
+from postgres_to_es.retries import CircuitBreaker, Retrying, RetryPolicy
+
+
+class Flaky:
+    """Fails the first `failures` calls"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self) -> str:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise OSError("unreachable")
+        return "done"
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(retries, "sleep", lambda delay: None)
+
+
+def retrying(attempts: int, threshold: int) -> Retrying:
+    policy = RetryPolicy(attempts, base_delay=0, max_delay=0, deadline=60)
+    breaker = CircuitBreaker("backend", threshold, cooldown=60)
+    return Retrying(policy, breaker, (OSError,))
+
+
+def test_call_outlasts_breaker_threshold():
+    # the defaults allow more attempts than failures opening the circuit
+    assert settings.retry_attempts > settings.breaker_threshold
+    retry = retrying(settings.retry_attempts, settings.breaker_threshold)
+    flaky = Flaky(settings.retry_attempts - 1)
+
+    assert retry.call(flaky) == "done"
+    assert flaky.calls == settings.retry_attempts
+    assert retry.breaker.failures == 0
+    assert retry.breaker.opened_at is None
+
+
+def test_given_up_call_is_one_failure():
+    retry = retrying(attempts=3, threshold=2)
+    flaky = Flaky(failures=10)
+
+    with pytest.raises(ConnectionFailedError) as raised:
+        retry.call(flaky)
+    assert not isinstance(raised.value, CircuitOpenError)
+    assert flaky.calls == 3
+    assert retry.breaker.failures == 1
+    assert retry.breaker.opened_at is None
+
+
+def test_given_up_calls_open_circuit():
+    retry = retrying(attempts=3, threshold=2)
+    flaky = Flaky(failures=10)
+    for _ in range(2):
+        with pytest.raises(ConnectionFailedError):
+            retry.call(flaky)
+
+    with pytest.raises(CircuitOpenError):
+        retry.call(flaky)
+    assert flaky.calls == 6
+
+
+def test_probe_retries_and_lets_nested_calls_through():
+    retry = retrying(attempts=3, threshold=1)
+    with pytest.raises(ConnectionFailedError):
+        retry.call(Flaky(failures=10))
+    retry.breaker.opened_at -= retry.breaker.cooldown
+
+    # the probe fails once and takes a nested call to the same backend
+    flaky = Flaky(failures=1)
+    assert retry.call(lambda: retry.call(flaky)) == "done"
+    assert retry.breaker.opened_at is None
+    assert not retry.breaker.probing
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+from typing import Any
+from uuid import UUID
+
+from postgres_to_es.config.settings import settings
+from postgres_to_es.models import Entry
+from postgres_to_es.scheduling import Scheduler, latest_sql
+from postgres_to_es.state import State, serialize_entry
+
+TABLE = "content.film_work"
+LOADED = datetime(2023, 5, 1)
+
+
+class Storage:
+    def __init__(self, state: dict[str, Any]):
+        self.state = state
+
+    def retrieve_state(self) -> dict[str, Any]:
+        return dict(self.state)
+
+
+def entry(modified: datetime, id_: int) -> Entry:
+    return Entry(modified=modified, id=UUID(int=id_))
+
+
+def sharded_state() -> State:
+    return State(
+        Storage(  # type: ignore
+            {
+                f"movies:{TABLE}:0": serialize_entry(entry(LOADED, 1)),
+                f"movies:{TABLE}:1": serialize_entry(entry(LOADED, 2**127 + 1)),
+            }
+        )
+    )
+
+
+def test_sharded_watermarks_are_compared_by_shard(monkeypatch):
+    monkeypatch.setattr(settings, "shard_count", 2)
+    scheduler = Scheduler(["movies"], [(TABLE, 100)])
+    state = sharded_state()
+    latest = {(TABLE, 0): entry(LOADED, 1), (TABLE, 1): entry(LOADED, 2**127 + 1)}
+
+    assert not scheduler._behind(state, "movies", TABLE, latest)
+
+    latest[(TABLE, 1)] = entry(LOADED + timedelta(seconds=1), 2**127 + 5)
+    assert scheduler._behind(state, "movies", TABLE, latest)
+
+
+def test_latest_rows_are_read_by_shard(monkeypatch):
+    monkeypatch.setattr(settings, "shard_count", 2)
+    sql, sql_vars = latest_sql([TABLE], Scheduler(["movies"], []).shards)
+
+    assert sql.count("union all") == 1
+    assert sql_vars == (
+        str(UUID(int=0)),
+        str(UUID(int=2**127)),
+        str(UUID(int=2**127)),
+    )
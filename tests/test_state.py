@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime
+from typing import Any
+from uuid import uuid4
+
+import pytest
+
+from postgres_to_es.aio.state import AsyncState
+from postgres_to_es.models import Entry
+from postgres_to_es.state import State
+
+
+class Storage:
+    def __init__(self):
+        self.saves: list[dict[str, Any]] = []
+
+    def save_state(self, state: dict[str, Any]):
+        self.saves.append(dict(state))
+
+    def retrieve_state(self) -> dict[str, Any]:
+        return {}
+
+
+class AsyncStorage(Storage):
+    async def save_state(self, state: dict[str, Any]):  # type: ignore
+        super().save_state(state)
+
+    async def retrieve_state(self) -> dict[str, Any]:  # type: ignore
+        return {}
+
+
+def checkpoint() -> Entry:
+    return Entry(id=uuid4(), modified=datetime.utcnow())
+
+
+def sync_checkpoints(storage: Storage, count: int):
+    state = State(storage, flush_size=10)  # type: ignore
+    for number in range(count):
+        state.set_state(f"movies:table_{number % 2}", checkpoint())
+
+
+def async_checkpoints(storage: Storage, count: int):
+    async def run():
+        state = AsyncState(storage, flush_size=10)  # type: ignore
+        await state.refresh()
+        for number in range(count):
+            await state.set_state(f"movies:table_{number % 2}", checkpoint())
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    ("checkpoints", "storage_class"),
+    [(sync_checkpoints, Storage), (async_checkpoints, AsyncStorage)],
+)
+def test_flushes_every_flush_size_checkpoints(checkpoints, storage_class):
+    # two watermarks moved over and over never make flush_size keys
+    storage = storage_class()
+    checkpoints(storage, 25)
+
+    assert len(storage.saves) == 2
+    assert all(len(saved) == 2 for saved in storage.saves)